@@ -1,4 +1,33 @@
 from db import execute_query, get_connection
+from versions import bump_table_versions
+
+UNCLASSIFIED = "Unclassified"
+
+
+def load_rules():
+    """Classification rules in match order: priority, then longest pattern first."""
+    rules = execute_query(
+        """
+        SELECT description_pattern, category
+        FROM debit_classifications
+        ORDER BY priority ASC, LENGTH(description_pattern) DESC
+        """,
+        fetch=True
+    )
+    return [(r['description_pattern'].lower(), r['category']) for r in rules or []]
+
+def classify_description(description, rules):
+    """Return the category of the first rule whose pattern is contained in description."""
+    text = (description or "").lower()
+    for pattern, category in rules:
+        if pattern in text:
+            return category
+    return UNCLASSIFIED
+
+def classify_series(descriptions, rules):
+    """Classify a pandas Series of descriptions, matching each distinct description once."""
+    mapping = {d: classify_description(d, rules) for d in descriptions.unique()}
+    return descriptions.map(mapping)
 
 def classify_debits():
     """Classify all unclassified debits safely."""
@@ -22,6 +51,7 @@ def classify_debits():
 
     conn = get_connection()
     cursor = conn.cursor()
+    applied = 0
     for debit in debits:
         for rule in rules:
             if rule['description_pattern'].lower() in (debit['description'] or '').lower():
@@ -29,7 +59,10 @@ def classify_debits():
                     "INSERT INTO debit_classifications_applied (transaction_id, category) VALUES (%s,%s)",
                     (debit['id'], rule['category'])
                 )
+                applied += 1
                 break
+    if applied:
+        bump_table_versions(cursor, "debit_classifications_applied")
     conn.commit()
     cursor.close()
     conn.close()
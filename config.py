@@ -4,3 +4,57 @@ MYSQL_CONFIG = {
     "password": "j301052",
     "database": "sales_analysis"
 }
+
+# Terminal id of the shop's POS, as it appears in bank descriptions ("00992577 POS ...")
+POS_TERMINAL_ID = "00992577"
+
+# Payment methods in the sales table that the card / cash reconciliation uses
+CARD_METHOD = "Cartão Débito"
+CASH_METHOD = "Dinheiro"
+
+# Output formats of main.py --format and /reports/download
+REPORT_FORMATS = ("xlsx", "parquet", "csv")
+
+# Pooled MySQL connections per process (db.get_connection) and threads that
+# run a dashboard request's independent queries concurrently (db.run_concurrently)
+DB_POOL_SIZE = 8
+QUERY_FANOUT_WORKERS = 4
+
+# Dashboard background jobs (imports, reconciliation), per worker process.
+# Importers rewrite the same daily_reconciliation rows, so every import also
+# holds the MySQL lock "imports" (db.named_lock): imports run one at a time
+# across dashboard workers and main.py, waiting at most IMPORT_LOCK_TIMEOUT
+# seconds for the previous one.
+JOB_WORKERS = 1
+IMPORT_LOCK_TIMEOUT = 600
+# Job states shared by the dashboard worker processes (jobs.py)
+JOB_STATE_PATH = "cache/jobs.sqlite3"
+
+# Per-file import profiles record peak memory as sampled RSS; this switches
+# them to tracemalloc's exact peak. Off by default: tracing slows the
+# importers down several times.
+IMPORT_TRACE_MEMORY = False
+
+# Dashboard request profiling: when enabled, ?profile=1 (or an "X-Profile: 1"
+# header) saves a call-tree profile of that request to PROFILE_DIR.
+REQUEST_PROFILING = False
+PROFILE_DIR = "profiles"
+PROFILE_INTERVAL = 0.001  # sampling interval in seconds (pyinstrument)
+
+# Memory cap of the dashboard's query result cache (query_cache.py)
+QUERY_CACHE_MAX_BYTES = 64 * 2 ** 20
+# "memory" (per process) or "sqlite" (one file shared by all dashboard workers)
+QUERY_CACHE_BACKEND = "memory"
+QUERY_CACHE_PATH = "cache/query_cache.sqlite3"
+
+# Production server (gunicorn -c gunicorn.conf.py): listen address, worker
+# processes and threads per worker. Workers are forked from a master that has
+# already loaded the app and warmed its caches.
+SERVER_BIND = "0.0.0.0:5001"
+SERVER_WORKERS = 2
+SERVER_THREADS = 8
+# After a dashboard import, gracefully restart the workers from a re-warmed
+# master. Off by default: the version-checked caches already pick up the new
+# data, and a reload stops the jobs and event streams of the other workers
+# (their jobs are then reported as failed).
+RELOAD_WORKERS_AFTER_IMPORT = False
@@ -0,0 +1,176 @@
+"""
+Daily sales vs deposits grid.
+
+Builds the per-day rows behind /sales_vs_deposits in one vectorized pass.
+Daily sums (per payment method and per bank credit kind) are read from the
+daily_reconciliation rollup over a window that only reaches back to the last
+DEPOSITO before the earliest requested period; balances and cash cycles are
+then computed as array operations on integer cents.
+"""
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from query_cache import cached_query, cached_value
+from request_timing import timed
+from config import CARD_METHOD, CASH_METHOD
+
+DAILY_COLUMNS = ["sales_card", "sales_cash", "bank_pos", "bank_deposit", "tsc"]
+
+
+# ---------------- SQL WINDOW ----------------
+def fetch_daily_window(first_start, end_date):
+    """
+    Read per-day sums from the daily_reconciliation rollup, from the last
+    DEPOSITO strictly before first_start (or the beginning of the records
+    when there is none) through end_date, in one round trip. Returns a
+    DataFrame indexed by day with DAILY_COLUMNS in integer cents.
+    """
+    rows = cached_query("""
+        SELECT date AS day, sales_card, sales_cash, bank_pos, bank_deposit, tsc
+        FROM daily_reconciliation
+        WHERE date BETWEEN COALESCE(
+                  (SELECT MAX(date)
+                   FROM daily_reconciliation
+                   WHERE bank_deposit > 0
+                     AND date < %s),
+                  %s)
+              AND %s
+        ORDER BY date
+    """, (first_start, date(1900, 1, 1), end_date), ("daily_reconciliation",))
+
+    daily = pd.DataFrame(rows, columns=["day"] + DAILY_COLUMNS).set_index("day")
+    daily.index = pd.to_datetime(daily.index)
+
+    first_day = daily.index.min()
+    if pd.isna(first_day):
+        first_day = pd.Timestamp(end_date)
+
+    daily = daily.reindex(pd.date_range(first_day, end_date), columns=DAILY_COLUMNS)
+    return to_cents(daily)
+
+
+def to_cents(df):
+    """Convert Decimal/float money columns to int64 cents (NaN -> 0)."""
+    return (df.apply(pd.to_numeric).fillna(0).astype(float) * 100).round().astype("int64")
+
+
+def cents_to_decimal(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+# ---------------- DAILY GRID ----------------
+def build_period(daily, start_date, end_date):
+    """
+    Build one entry of `all_periods` from the daily cents frame.
+
+    Card:  diff_card = POS - card sales, card_balance is its running sum.
+    Cash:  a DEPOSITO closes the cash cycle up to yesterday; today's cash
+           always belongs to the next cycle (same rule as deposit_breakdown).
+    """
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date)
+
+    # ---- PREVIOUS DEPOSITO + CASH PRELOAD ----
+    before = daily.loc[daily.index < start_ts]
+    deposit_days = before.index[before["bank_deposit"].to_numpy() > 0]
+    prev_deposit_date = deposit_days.max().date() if len(deposit_days) else None
+
+    if prev_deposit_date:
+        preload = int(before.loc[before.index >= pd.Timestamp(prev_deposit_date), "sales_cash"].sum())
+    else:
+        preload = int(before["sales_cash"].sum())
+
+    grid = daily.reindex(pd.date_range(start_ts, end_ts), fill_value=0)
+
+    card = grid["sales_card"].to_numpy()
+    cash = grid["sales_cash"].to_numpy()
+    pos = grid["bank_pos"].to_numpy()
+    deposit = grid["bank_deposit"].to_numpy()
+    tsc = grid["tsc"].to_numpy()
+
+    # ---- CARD ----
+    card_diff = pos - card
+    card_balance = np.cumsum(card_diff)
+
+    # ---- CASH CYCLES ----
+    # cash_upto[i]: preload + all cash strictly before day i
+    # cycle_base[i]: cash_upto at the last deposit strictly before day i
+    has_deposit = deposit > 0
+    cash_upto = preload + np.concatenate(([0], np.cumsum(cash)[:-1]))
+    cycle_base = (
+        pd.Series(np.where(has_deposit, cash_upto, np.nan))
+        .shift(1)
+        .ffill()
+        .fillna(0)
+        .to_numpy(dtype="int64")
+    )
+    cash_before_deposit = cash_upto - cycle_base
+    cash_diff = np.where(has_deposit, deposit - cash_before_deposit, 0)
+    cash_balance = np.cumsum(cash_diff)
+
+    total_diff = card_diff + cash_diff
+
+    deposit_note = (
+        f"Inclui dinheiro desde depósito anterior ({prev_deposit_date})"
+        if prev_deposit_date
+        else "Inclui dinheiro desde início dos registos"
+    )
+
+    rows = []
+    for i, ts in enumerate(grid.index):
+        d = ts.date()
+        rows.append({
+            "date": d,
+            "day_name": d.strftime("%a"),
+            "sales_card": cents_to_decimal(card[i]),
+            "sales_cash": cents_to_decimal(cash[i]),
+            "sales_total": cents_to_decimal(card[i] + cash[i]),
+            "bank_pos": cents_to_decimal(pos[i]),
+            "tsc": cents_to_decimal(tsc[i]),
+            "bank_deposit": cents_to_decimal(deposit[i]),
+            "diff_card": cents_to_decimal(card_diff[i]),
+            "diff_cash": cents_to_decimal(cash_diff[i]) if has_deposit[i] else None,
+            "diff_total": cents_to_decimal(total_diff[i]),
+            "card_balance": cents_to_decimal(card_balance[i]),
+            "cash_balance": cents_to_decimal(cash_balance[i]),
+            "cash_before_deposit": cents_to_decimal(cash_before_deposit[i]) if has_deposit[i] else None,
+            "deposit_note": deposit_note if i == 0 else None,
+        })
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_sales": cents_to_decimal((card + cash).sum()),
+        "total_credits": cents_to_decimal(deposit.sum()),
+        "total_diff": cents_to_decimal(total_diff.sum()),
+        "rows": rows,
+    }
+
+
+def build_periods(periods):
+    """
+    Build `all_periods` for a list of (start_date, end_date) tuples from a
+    single SQL window covering all of them. Cached until daily_reconciliation
+    changes.
+    """
+    if not periods:
+        return []
+    return cached_value(
+        ("sales_vs_deposits", tuple(periods)),
+        ("daily_reconciliation",),
+        lambda: compute_periods(periods)
+    )
+
+
+@timed("pandas")
+def compute_periods(periods):
+
+    first_start = min(p[0] for p in periods)
+    last_end = max(p[1] for p in periods)
+
+    daily = fetch_daily_window(first_start, last_end)
+
+    return [build_period(daily, start, end) for start, end in periods]
@@ -0,0 +1,114 @@
+"""
+Maintained daily rollup: one row per day in `daily_reconciliation`.
+
+Holds sales per payment method, bank credits per kind (POS / DEPOSITO /
+other), debits and TPA TSC; the table is defined in models.TABLES.
+Importers call refresh_daily_reconciliation() for the days they touched,
+so readers (charts, sales_vs_deposits) only scan a few hundred
+pre-aggregated rows. The monthly reconciliation report does not use it: it
+groups bank credits by transaction_date.
+
+Bank columns are keyed by movement_date, the same day sales_vs_deposits uses.
+"""
+from datetime import date, timedelta
+
+from db import get_connection, execute_query
+from config import CARD_METHOD, CASH_METHOD
+from versions import bump_table_versions
+
+FIRST_DAY = date(1900, 1, 1)
+LAST_DAY = date(9999, 12, 31)
+
+_ROLLUP_SQL = """
+    INSERT INTO daily_reconciliation
+        (date, sales_card, sales_cash, sales_other, sales,
+         bank_pos, bank_deposit, bank_other, bank, debits, tsc)
+    SELECT day,
+           SUM(sales_card), SUM(sales_cash), SUM(sales_other), SUM(sales),
+           SUM(bank_pos), SUM(bank_deposit), SUM(bank_other), SUM(bank),
+           SUM(debits), SUM(tsc)
+    FROM (
+        SELECT sale_date AS day,
+               CASE WHEN payment_method = %s THEN amount ELSE 0 END AS sales_card,
+               CASE WHEN payment_method = %s THEN amount ELSE 0 END AS sales_cash,
+               CASE WHEN payment_method NOT IN (%s, %s) THEN amount ELSE 0 END AS sales_other,
+               amount AS sales,
+               0 AS bank_pos, 0 AS bank_deposit, 0 AS bank_other, 0 AS bank, 0 AS debits, 0 AS tsc
+        FROM sales
+        WHERE sale_date BETWEEN %s AND %s
+
+        UNION ALL
+
+        SELECT movement_date,
+               0, 0, 0, 0,
+               CASE WHEN transaction_type = 'credit' AND description LIKE '%POS VENDAS%' THEN amount ELSE 0 END,
+               CASE WHEN transaction_type = 'credit' AND description LIKE '%DEPOSITO%' THEN amount ELSE 0 END,
+               CASE WHEN transaction_type = 'credit'
+                         AND description NOT LIKE '%POS VENDAS%'
+                         AND description NOT LIKE '%DEPOSITO%' THEN amount ELSE 0 END,
+               CASE WHEN transaction_type = 'credit' THEN amount ELSE 0 END,
+               CASE WHEN transaction_type = 'debit' THEN ABS(amount) ELSE 0 END,
+               0
+        FROM bank_transactions
+        WHERE movement_date BETWEEN %s AND %s
+
+        UNION ALL
+
+        SELECT DATE(data),
+               0, 0, 0, 0,
+               0, 0, 0, 0, 0,
+               tsc
+        FROM tpa_movements
+        WHERE data >= %s AND data < %s
+    ) x
+    GROUP BY day
+"""
+
+
+def refresh_daily_reconciliation(start_date=None, end_date=None):
+    """
+    Recompute the rollup rows for start_date..end_date (inclusive) in one
+    transaction. No bounds = full rebuild.
+    """
+    start_date = start_date or FIRST_DAY
+    end_date = end_date or LAST_DAY
+    next_day = end_date + timedelta(days=1) if end_date < LAST_DAY else end_date
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM daily_reconciliation WHERE date BETWEEN %s AND %s",
+            (start_date, end_date)
+        )
+        cursor.execute(_ROLLUP_SQL, (
+            CARD_METHOD, CASH_METHOD, CARD_METHOD, CASH_METHOD, start_date, end_date,
+            start_date, end_date,
+            start_date, next_day,
+        ))
+        bump_table_versions(cursor, "daily_reconciliation")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def refresh_for_results(results):
+    """Refresh the days covered by importer result dicts (status ok + min/max_date)."""
+    for r in results:
+        if r.get("status") == "ok" and r.get("min_date") and r.get("max_date"):
+            refresh_daily_reconciliation(
+                date.fromisoformat(str(r["min_date"])),
+                date.fromisoformat(str(r["max_date"]))
+            )
+
+
+def build_daily_reconciliation_if_empty():
+    """Build the rollup from scratch the first time (table created by models.create_tables)."""
+    rows = execute_query("SELECT COUNT(*) AS n FROM daily_reconciliation", fetch=True)
+    if not rows or not rows[0]["n"]:
+        refresh_daily_reconciliation()
+        print("Table 'daily_reconciliation' rebuilt.")
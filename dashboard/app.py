@@ -1,22 +1,38 @@
-import json
-from db import get_connection
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, Blueprint, jsonify, current_app
+import io
+import gzip
+import hashlib
+import importlib
+import signal
+from db import get_connection, named_lock, run_concurrently, unpooled
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, Blueprint, jsonify, current_app, Response, send_file, stream_with_context, g, session
+from flask.signals import before_render_template, template_rendered
 from datetime import date, datetime, timedelta
-from db import execute_query
 import pandas as pd
 import os
 from decimal import Decimal
-import subprocess
 import re
 import mysql.connector
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-from import_csv import import_single_bank_csv
-from import_csv import import_single_tpa_csv
-from import_pdf import import_single_sales_pdf
+from daily_grid import build_periods
+from daily_rollup import build_daily_reconciliation_if_empty, refresh_daily_reconciliation
+from config import POS_TERMINAL_ID, REQUEST_PROFILING, PROFILE_DIR, PROFILE_INTERVAL, RELOAD_WORKERS_AFTER_IMPORT
+from expenses_data import build_expenses_view, columnar_view, transactions_page
+from fast_json import FastJSONProvider, dumps, dumps_bytes, to_columns
+from static_assets import VENDOR_MAX_AGE, ensure_plotly_js
+from versions import bump_table_versions, get_table_versions
+from models import create_tables
+from query_cache import cached_query, cached_value
+from downsample import parse_max_points, downsample
+from rollup_cube import CUBE_TABLES, decode_cursor, get_cube, refresh_cube_for_results, invalidate_cube
+from jobs import submit_job, get_job
+from import_profile import ImportProfile, merge_profiles
+from request_timing import start_request, end_request, current_timings, server_timing_header, start_profiler, save_profile, timed
+from reports import REPORT_FORMATS, REPORT_QUERIES, build_report_sources, report_slug, iter_csv_chunks, write_parquet, write_workbook
 
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 # ✅ REQUIRED for sessions + flash
 app.secret_key = os.environ.get(
     "FLASK_SECRET_KEY",
@@ -26,11 +42,145 @@ UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
+# ---------------- STATIC ASSETS ----------------
+PLOTLY_JS = os.path.basename(ensure_plotly_js())
+
+
+@app.context_processor
+def inject_asset_urls():
+    return {"plotly_js_url": url_for('static', filename=f"vendor/{PLOTLY_JS}")}
+
+
+@app.after_request
+def cache_vendor_assets(response):
+    """Versioned vendor files never change: let browsers keep them for a year."""
+    if request.path.startswith("/static/vendor/") and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = VENDOR_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+# ---------------- COMPRESSION ----------------
+GZIP_MIMETYPES = {"application/json", "text/html"}
+GZIP_MIN_BYTES = 500
+
+
+@app.after_request
+def gzip_response(response):
+    """Gzip JSON and HTML responses when the client accepts it."""
+    if (
+        "gzip" not in request.headers.get("Accept-Encoding", "").lower()
+        or response.mimetype not in GZIP_MIMETYPES
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# ---------------- CONDITIONAL GET ----------------
+# Data endpoints send a weak ETag made of their request parameters and the
+# table_versions of the tables behind the data: a client that already holds
+# that version gets 304 Not Modified and nothing is rebuilt.
+def data_etag(tables, params):
+    versions = sorted(get_table_versions(*tables).items())
+    return hashlib.sha256(dumps_bytes([versions, params])).hexdigest()[:32]
+
+
+def conditional_json(tables, params, build):
+    """jsonify(build()) with a version ETag, or 304 when If-None-Match has it."""
+    etag = data_etag(tables, params)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # revalidate every time, 304 when unchanged
+    return response
+
+
+@app.after_request
+def etag_chart_images(response):
+    """
+    Chart PNG names are content hashes (visualize.chart_cache_path), but
+    their mtime changes whenever a render is reused; validate by name only.
+    """
+    if request.path.startswith("/static/charts/") and request.path.endswith(".png") and response.status_code == 200:
+        response.set_etag(os.path.splitext(os.path.basename(request.path))[0])
+        response.headers.pop("Last-Modified", None)
+        response.make_conditional(request)
+    return response
+
+
+# ---------------- REQUEST TIMING ----------------
+# Server-Timing on every response; ?profile=1 / "X-Profile: 1" saves a
+# call-tree profile of the request when REQUEST_PROFILING is enabled.
+def wants_profile():
+    return REQUEST_PROFILING and "1" in (request.args.get("profile"), request.headers.get("X-Profile"))
+
+
+@app.before_request
+def start_request_timing():
+    start_request()
+    g.profiler = None
+    if wants_profile():
+        try:
+            g.profiler = start_profiler(PROFILE_INTERVAL)
+        except ValueError:  # another request is being profiled (cProfile)
+            pass
+
+
+@app.after_request
+def add_server_timing(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        path = save_profile(profiler, PROFILE_DIR, request.endpoint or "request")
+        response.headers["X-Profile-File"] = os.path.basename(path)
+
+    timings = current_timings()
+    if timings is not None:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.teardown_request
+def end_request_timing(exc):
+    end_request()
+
+
+@before_render_template.connect_via(app)
+def time_render_start(sender, **extra):
+    timings = current_timings()
+    if timings is not None:
+        timings.enter("render")
+
+
+@template_rendered.connect_via(app)
+def time_render_end(sender, **extra):
+    timings = current_timings()
+    if timings is not None and timings.stack and timings.stack[-1][0] == "render":
+        timings.exit()
+
+
 @app.route('/upload/<file_type>', methods=['POST'])
 def upload(file_type):
+    if file_type not in ("bank", "sales", "tpa"):
+        abort(404)
+
     uploaded_files = request.files.getlist('files[]')
     saved_files = []
-    all_results = []
 
     for file in uploaded_files:
         # --- Validation for sales files ---
@@ -48,14 +198,31 @@ def upload(file_type):
         file.save(dest_path)
         saved_files.append(dest_path)
 
-    # --- Call importers PER FILE (not per folder) ---
-    for file_path in saved_files:
-        if file_type == "bank":
-            all_results.append(import_single_bank_csv(file_path))
-        elif file_type == "sales":
-            all_results.append(import_single_sales_pdf(file_path))
-        elif file_type == "tpa":
-            all_results.append((import_single_tpa_csv(file_path)))
+    # --- Import PER FILE (not per folder) in a background job ---
+    def run_import(job):
+        # imported here so pdfplumber / unidecode only load when files are uploaded
+        from import_csv import import_single_bank_csv, import_single_tpa_csv
+        from import_pdf import import_single_sales_pdf
+
+        importers = {
+            "bank": import_single_bank_csv,
+            "sales": import_single_sales_pdf,
+            "tpa": import_single_tpa_csv,
+        }
+        with named_lock("imports"):
+            for file_path in saved_files:
+                job.start_file(os.path.basename(file_path))
+                job.file_done(importers[file_type](file_path))
+
+            if file_type == "bank":
+                refresh_cube_for_results(job.results)
+        reload_workers_for_results(job.results)
+
+        return {
+            "status": "success",
+            "summary": build_import_summary(job.results),
+            "results": job.results
+        }
 
     # --- Build summary ---
     def build_import_summary(results):
@@ -79,16 +246,134 @@ def upload(file_type):
                     summary["max_date"] = dmax if summary["max_date"] is None else max(summary["max_date"], dmax)
             else:
                 summary["files_error"] += 1
+        summary["profile"] = merge_profiles(r["profile"] for r in results if "profile" in r)
         return summary
 
-    summary = build_import_summary(all_results)
-    return jsonify({
-        "status": "success",
-        "summary": summary,
-        "results": all_results
-    })
+    job = submit_job(f"upload_{file_type}", run_import, [os.path.basename(p) for p in saved_files])
+    return jsonify(job_links(job)), 202
+
+
+# ---------------- JOBS ----------------
+JOB_KEEPALIVE_SECONDS = 15
+
+
+def job_links(job):
+    return {
+        "job_id": job.id,
+        "status_url": url_for('job_status', job_id=job.id),
+        "events_url": url_for('job_events', job_id=job.id),
+    }
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events: the job state after every change, until it finishes."""
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+
+    def stream():
+        revision = None
+        while True:
+            state = job.to_dict()
+            if state["revision"] != revision:
+                revision = state["revision"]
+                yield f"data: {dumps(state)}\n\n"
+            if state["status"] in ("done", "failed"):
+                return
+            if job.wait(revision, JOB_KEEPALIVE_SECONDS) == revision:
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def action_import_bank(job):
+    from import_csv import import_bank_csvs
+    folder = os.path.join(UPLOAD_DIR, 'bank')
+    os.makedirs(folder, exist_ok=True)
+    with named_lock("imports"):
+        results = import_bank_csvs(folder)
+        refresh_cube_for_results(results)
+    reload_workers_for_results(results)
+    return {"results": results}
+
+
+def action_import_sales(job):
+    from import_pdf import import_sales_pdfs
+    folder = os.path.join(UPLOAD_DIR, 'sales')
+    os.makedirs(folder, exist_ok=True)
+    with named_lock("imports"):
+        results = import_sales_pdfs(folder)
+    reload_workers_for_results(results)
+    return {"results": results}
+
+
+def action_daily_recon(job):
+    from reconciliation import reconcile_sales_vs_bank
+    unmatched_sales, unmatched_credits, duplicates = reconcile_sales_vs_bank()
+    return {
+        "unmatched_sales": len(unmatched_sales),
+        "unmatched_credits": len(unmatched_credits),
+        "duplicate_credits": len(duplicates),
+    }
 
 
+DASHBOARD_ACTIONS = {
+    'upload_bank': action_import_bank,
+    'upload_sales': action_import_sales,
+    'daily_recon': action_daily_recon,
+}
+
+
+def job_outcome(state):
+    """(flash category, message) for a finished dashboard action."""
+    title = state["kind"].replace('_', ' ').title()
+    if state["status"] == "failed":
+        return 'danger', f"{title} failed: {state['error']}"
+
+    result = state["result"] or {}
+    if "results" in result:
+        files = result["results"]
+        errors = [f"{r['file']}: {r.get('message')}" for r in files if r.get("status") != "ok"]
+        message = f"{title} completed: {len(files) - len(errors)} of {len(files)} files imported"
+        if errors:
+            return 'danger', f"{message}. Failed: " + "; ".join(errors)
+        return 'success', message
+
+    details = ", ".join(f"{name.replace('_', ' ')}: {value}" for name, value in result.items())
+    return 'success', f"{title} completed ({details})"
+
+
+def flash_dashboard_jobs():
+    """
+    Flash the outcome of the actions this browser started from the dashboard
+    form once they have finished; running ones stay in the session.
+    """
+    pending = []
+    for job_id in session.get('dashboard_jobs', []):
+        job = get_job(job_id)
+        if job is None:
+            continue  # expired
+        state = job.to_dict()
+        if state["status"] in ("done", "failed"):
+            flash(*reversed(job_outcome(state)))
+        else:
+            flash(f"{state['kind'].replace('_', ' ').title()} is still running, reload for its result", 'success')
+            pending.append(job_id)
+    session['dashboard_jobs'] = pending
+
 
 # ---------------- DASHBOARD ----------------
 @app.route('/', methods=['GET', 'POST'])
@@ -97,37 +382,18 @@ def dashboard():
     if request.method == 'POST':
         action = request.form.get('action')
 
-        scripts = {
-            'upload_bank': 'import_csv.py',
-            'upload_sales': 'import_pdf.py',
-            'daily_recon': 'reconciliation.py'
-        }
-
-        if action in scripts:
-            script_path = os.path.join(BASE_DIR, '..', scripts[action])
-            result = subprocess.run(
-                ['python', script_path],
-                capture_output=True,
-                text=True
-            )
-
-            if result.returncode == 0:
-                flash(f"{action.replace('_', ' ').title()} completed successfully", 'success')
-                if result.stdout:
-                    flash(result.stdout, 'success')
-            else:
-                flash(f"{action.replace('_', ' ').title()} failed", 'danger')
-                flash(result.stderr, 'danger')
+        if action in DASHBOARD_ACTIONS:
+            job = submit_job(action, DASHBOARD_ACTIONS[action])
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify(job_links(job)), 202
+            session['dashboard_jobs'] = session.get('dashboard_jobs', []) + [job.id]
 
         return redirect(url_for('dashboard'))
 
+    flash_dashboard_jobs()
+
     # ---------------- LOAD DEBIT CLASSIFICATIONS ----------------
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM debit_classifications ORDER BY id")
-    classifications = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    classifications = cached_query("SELECT * FROM debit_classifications ORDER BY id", None, ("debit_classifications",))
 
     return render_template('dashboard.html', classifications=classifications)
 
@@ -182,92 +448,14 @@ def expenses_vs_sales():
     end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
 
     # ------------------------------------------------------------------
-    # CATEGORIES (EXPENSES ONLY — POSITIVE, CONSISTENT WITH CHART)
-    # ------------------------------------------------------------------
-    categories = execute_query(
-        """
-        SELECT 
-            COALESCE(c.category,'Unclassified') AS category,
-            COUNT(*) AS tx_count,
-            SUM(ABS(t.amount)) AS total_amount
-        FROM bank_transactions t
-        LEFT JOIN debit_classifications c
-          ON c.id = (
-              SELECT dc.id
-              FROM debit_classifications dc
-              WHERE t.description LIKE CONCAT('%', dc.description_pattern, '%')
-              ORDER BY dc.priority ASC, LENGTH(dc.description_pattern) DESC
-              LIMIT 1
-          )
-
-        WHERE t.transaction_type = 'debit'
-          AND DATE(t.transaction_date) BETWEEN %s AND %s
-        GROUP BY category
-        ORDER BY total_amount DESC
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
-
-    total_expenses = sum(c['total_amount'] for c in categories) if categories else 0
-    total_tx = sum(c['tx_count'] for c in categories) if categories else 0
-
-    for c in categories:
-        c['percent'] = (c['total_amount'] / total_expenses * 100) if total_expenses else 0
-
-    # ------------------------------------------------------------------
-    # TRANSACTIONS (FOR MODAL)
-    # ------------------------------------------------------------------
-    transactions = execute_query(
-        """
-        SELECT 
-            t.transaction_date AS date,
-            t.description,
-            ABS(t.amount) AS amount,
-            COALESCE(c.category,'Unclassified') AS category
-        FROM bank_transactions t
-        LEFT JOIN debit_classifications c
-          ON c.id = (
-              SELECT dc.id
-              FROM debit_classifications dc
-              WHERE t.description LIKE CONCAT('%', dc.description_pattern, '%')
-              ORDER BY dc.priority ASC, LENGTH(dc.description_pattern) DESC
-              LIMIT 1
-          )
-
-        WHERE t.transaction_type = 'debit'
-          AND DATE(t.transaction_date) BETWEEN %s AND %s
-        ORDER BY t.transaction_date ASC
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
-
-    transactions_json = json.dumps(transactions, default=str)
-
-    # ------------------------------------------------------------------
-    # CHART DATA (CANONICAL SOURCE OF TRUTH)
+    # CATEGORIES + CHART (modal transactions are fetched page by page)
     # ------------------------------------------------------------------
-    # --- Chart data: Expenses vs Sales (monthly) ---
-    chart_rows = execute_query(
-        """
-        SELECT
-            DATE_FORMAT(t.transaction_date, '%Y-%m') AS period,
-            SUM(CASE WHEN t.transaction_type = 'debit'  THEN ABS(t.amount) ELSE 0 END) AS expenses,
-            SUM(CASE WHEN t.transaction_type = 'credit' THEN t.amount ELSE 0 END) AS sales
-        FROM bank_transactions t
-        WHERE DATE(t.transaction_date) BETWEEN %s AND %s
-        GROUP BY period
-        ORDER BY period
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
+    data = build_expenses_view(start_date, end_date, view)
+    columns = columnar_view(data)
 
-    for r in chart_rows:
-        r['net'] = r['sales'] - r['expenses']
-
-    chart_json = json.dumps(chart_rows, default=str)
+    chart_json = dumps(columns["chart"])
+    category_chart_json = dumps(columns["category_chart"])
+    resolution_json = dumps(data["resolution"])
 
     # ------------------------------------------------------------------
     # RENDER
@@ -277,24 +465,28 @@ def expenses_vs_sales():
         start_date=start_date.strftime("%Y-%m-%d"),
         end_date=end_date.strftime("%Y-%m-%d"),
         view=view,
-        categories=categories,
-        total_amount=total_expenses,   # ← matches table + chart
-        total_tx=total_tx,
-        transactions_json=transactions_json,
-        chart_json=chart_json
+        categories=data["categories"],
+        total_amount=data["total_amount"],   # ← matches table + chart
+        total_tx=data["total_tx"],
+        chart_json=chart_json,
+        category_chart_json=category_chart_json,
+        resolution_json=resolution_json
     )
 
 
+def parse_date_arg(value, name):
+    """YYYY-MM-DD query parameter as a date; 400 naming the parameter when malformed."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        abort(400, f"Invalid {name}: {value!r} (expected YYYY-MM-DD)")
+
+
 @app.route('/sales_vs_deposits')
 def sales_vs_deposits():
     start_date_param = request.args.get('start_date')
     end_date_param = request.args.get('end_date')
 
-    start_date = parse_date_param(start_date_param) or pd.Timestamp.today().date()
-    end_date = parse_date_param(end_date_param) or pd.Timestamp.today().date()
-
-    # Your existing logic for sales vs deposits goes here
-
     today = date.today()
 
     if today.day > 8:
@@ -302,198 +494,30 @@ def sales_vs_deposits():
     else:
         default_start_date = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
 
-    start_date = (
-        datetime.strptime(start_date_param, "%Y-%m-%d").date()
-        if start_date_param
-        else default_start_date
-    )
-
-    end_date = (
-        datetime.strptime(end_date_param, "%Y-%m-%d").date()
-        if end_date_param
-        else today
-    )
-
-    # ---------------- SALES ----------------
-    sales = execute_query("""
-        SELECT DATE(sale_date) AS sale_date,
-               payment_method,
-               SUM(amount) AS amount
-        FROM sales
-        WHERE DATE(sale_date) <= %s
-        GROUP BY DATE(sale_date), payment_method
-    """, (end_date,), fetch=True)
-
-    sales_df = pd.DataFrame(sales, columns=["sale_date", "payment_method", "amount"])
-    if sales_df.empty:
-        sales_df = pd.DataFrame(columns=["sale_date", "payment_method", "amount"])
-
-    # ---------------- BANK ----------------
-    bank = execute_query("""
-        SELECT DATE(movement_date) AS transaction_date,
-               description,
-               amount
-        FROM bank_transactions
-        WHERE transaction_type = 'credit'
-          AND (description LIKE '%POS VENDAS%' OR description LIKE '%DEPOSITO%')
-          AND DATE(movement_date) <= %s
-    """, (end_date,), fetch=True)
-
-    bank_df = pd.DataFrame(bank, columns=["transaction_date", "description", "amount"])
-    if bank_df.empty:
-        bank_df = pd.DataFrame(columns=["transaction_date", "description", "amount"])
-
-    tpa = execute_query("""
-        SELECT DATE(data) AS tpa_date,
-               SUM(tsc) AS tsc
-        FROM tpa_movements
-        WHERE DATE(data) <= %s
-        GROUP BY DATE(data)
-    """, (end_date,), fetch=True)
-
-    tpa_df = pd.DataFrame(tpa, columns=["tpa_date", "tsc"])
-    if tpa_df.empty:
-        tpa_df = pd.DataFrame(columns=["tpa_date", "tsc"])
-    # ---------------- FIND PREVIOUS DEPOSITO ----------------
-    prev_dep_series = bank_df[
-        (bank_df.description.str.contains("DEPOSITO", na=False)) &
-        (bank_df.transaction_date < start_date)
-    ]["transaction_date"]
-
-    prev_deposit_date = prev_dep_series.max() if not prev_dep_series.empty else date(1900, 1 ,1)
-
-    # ---------------- PRELOAD CASH ACCUMULATOR ----------------
-    if prev_deposit_date:
-        preload_cash_df = sales_df[
-            (sales_df.payment_method == "Dinheiro") &
-            (sales_df.sale_date >= prev_deposit_date) &
-            (sales_df.sale_date < start_date)
-        ]
-    else:
-        preload_cash_df = sales_df[
-            (sales_df.payment_method == "Dinheiro") &
-            (sales_df.sale_date < start_date)
-        ]
-
-    cash_accumulator = Decimal(preload_cash_df["amount"].sum() or 0)
-
-    # ---------------- DAILY GRID ----------------
-    all_dates = pd.date_range(start_date, end_date)
-    rows = []
-
-    card_balance = Decimal("0.00")
-    cash_balance = Decimal("0.00")
-    first_deposit_seen = False
-
-    for d in all_dates:
-        d = d.date()
-
-        # ---- SALES ----
-        day_sales = sales_df[sales_df.sale_date == d]
-
-        card = Decimal(
-            day_sales.loc[
-                day_sales.payment_method == "Cartão Débito", "amount"
-            ].sum() or 0
-        )
-
-        cash = Decimal(
-            day_sales.loc[
-                day_sales.payment_method == "Dinheiro", "amount"
-            ].sum() or 0
-        )
-
-        total_sales = card + cash
-
-        # ---- BANK ----
-        day_bank = bank_df[bank_df.transaction_date == d]
-
-        pos = Decimal(
-            day_bank.loc[
-                day_bank.description.str.contains("POS VENDAS", na=False), "amount"
-            ].sum() or 0
-        )
-
-        deposit = Decimal(
-            day_bank.loc[
-                day_bank.description.str.contains("DEPOSITO", na=False), "amount"
-            ].sum() or 0
-        )
-
-        # ---- CARD ----
-        card_diff = pos - card
-        card_balance += card_diff
-
-        # ---- CASH (MATCHES deposit_breakdown EXACTLY) ----
-        cash_diff = None
-        cash_before_deposit = None
-        deposit_note = None
-
-        if deposit > 0:
-            # Deposit closes cash cycle up to YESTERDAY
-            cash_before_deposit = cash_accumulator
-            cash_diff = deposit - cash_accumulator
-            cash_balance += cash_diff
-
-            # Reset cycle
-            cash_accumulator = Decimal("0.00")
-
-            if not first_deposit_seen:
-                deposit_note = (
-                    f"Inclui dinheiro desde depósito anterior ({prev_deposit_date})"
-                    if prev_deposit_date
-                    else "Inclui dinheiro desde início dos registos"
-                )
-                first_deposit_seen = True
-
-        # Today's cash ALWAYS belongs to next cycle
-        cash_accumulator += cash
-
-        if not first_deposit_seen:
-                deposit_note = (
-                    f"Inclui dinheiro desde depósito anterior ({prev_deposit_date})"
-                    if prev_deposit_date
-                    else "Inclui dinheiro desde início dos registos"
-                )
-                first_deposit_seen = True
-
-        total_diff = card_diff + (cash_diff if cash_diff is not None else Decimal("0.00"))
-
-        tsc = Decimal(
-            tpa_df.loc[tpa_df.tpa_date == d, "tsc"].sum() or 0
-        )
-
-        rows.append({
-            "date": d,
-            "day_name": d.strftime("%a"),
-            "sales_card": card,
-            "sales_cash": cash,
-            "sales_total": total_sales,
-            "bank_pos": pos,
-            "tsc": tsc,
-            "bank_deposit": deposit,
-            "diff_card": card_diff,
-            "diff_cash": cash_diff,
-            "diff_total": total_diff,
-            "card_balance": card_balance,
-            "cash_balance": cash_balance,
-            "cash_before_deposit": cash_before_deposit,
-            "deposit_note": deposit_note,
-        })
-
-    # ---------------- TOTALS ----------------
-    total_sales_sum = sum(r["sales_total"] for r in rows)
-    total_deposits_sum = sum(r["bank_deposit"] for r in rows)
-    total_diff_sum = sum(r["diff_total"] for r in rows)
-
-    all_periods = [{
-        "start_date": start_date,
-        "end_date": end_date,
-        "total_sales": total_sales_sum,
-        "total_credits": total_deposits_sum,
-        "total_diff": total_diff_sum,
-        "rows": rows
-    }]
+    start_date = parse_date_arg(start_date_param, "start_date") if start_date_param else default_start_date
+    end_date = parse_date_arg(end_date_param, "end_date") if end_date_param else today
+
+    # ---------------- PERIODS ----------------
+    # Extra periods can be requested as ?period=YYYY-MM-DD:YYYY-MM-DD (repeatable);
+    # all of them are built from the same SQL window and daily pass.
+    periods = []
+    for p in request.args.getlist('period'):
+        p_start, _, p_end = p.partition(':')
+        periods.append((
+            parse_date_arg(p_start, "period"),
+            parse_date_arg(p_end, "period") if p_end else end_date,
+        ))
+    if not periods:
+        periods = [(start_date, end_date)]
+
+    all_periods = build_periods(periods)
+
+    if request.args.get('format') == 'json':
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "periods": [dict(p, rows=to_columns(p["rows"])) for p in all_periods],
+        }
 
     return render_template(
         "sales_vs_deposits.html",
@@ -545,58 +569,15 @@ def expenses_drilldown():
 
     title = period  # e.g., "Nov 2025"
 
-    # Aggregate categories, descending
-    categories = execute_query(
-        """
-        SELECT 
-            COALESCE(c.category, 'Unclassified') AS category,
-            COUNT(*) AS tx_count,
-            SUM(t.amount) AS total_amount
-        FROM bank_transactions t
-        LEFT JOIN debit_classifications c
-            ON t.description LIKE CONCAT('%', c.description_pattern, '%')
-        WHERE t.transaction_type='debit'
-          AND DATE(t.transaction_date) BETWEEN %s AND %s
-        GROUP BY category
-        ORDER BY total_amount DESC
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
-
-    # Compute totals
-    total_amount = sum(c['total_amount'] for c in categories) if categories else 0
-    total_tx = sum(c['tx_count'] for c in categories) if categories else 0
-
-    # Compute percentages
-    for c in categories:
-        c['percent'] = (c['total_amount']/total_amount*100) if total_amount else 0
-
-        # Add period info for drill-down links (optional)
-        c['period'] = period
-        c['start_date'] = start_date
-        c['end_date'] = end_date
-
-    # Fetch all transactions for modal
-    transactions = execute_query(
-        """
-        SELECT 
-            t.transaction_date AS date,
-            t.description,
-            t.amount,
-            COALESCE(c.category,'Unclassified') AS category
-        FROM bank_transactions t
-        LEFT JOIN debit_classifications c
-            ON t.description LIKE CONCAT('%', c.description_pattern, '%')
-        WHERE t.transaction_type='debit'
-          AND DATE(t.transaction_date) BETWEEN %s AND %s
-        ORDER BY t.transaction_date ASC
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
+    data = build_expenses_view(start_date, end_date, view)
+    # Add period info for drill-down links (copies: data may be cached)
+    categories = [
+        dict(c, period=period, start_date=start_date, end_date=end_date)
+        for c in data["categories"]
+    ]
 
-    transactions_json = json.dumps(transactions, default=str)
+    total_amount = data["total_amount"]
+    total_tx = data["total_tx"]
 
     return render_template(
         'expenses_vs_sales_drilldown.html',
@@ -604,7 +585,8 @@ def expenses_drilldown():
         categories=categories,
         total_amount=total_amount,
         total_tx=total_tx,
-        transactions_json=transactions_json,
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
         view=view
     )
 
@@ -622,6 +604,7 @@ def parse_date_param(param):
     return pd.to_datetime(param).date()
 
 @app.route('/bank_details')
+@timed("pandas")
 def bank_details():
     # ---------------- PARSE DATES ----------------
     date_param = request.args.get('date')
@@ -632,78 +615,94 @@ def bank_details():
     start_date = parse_date_param(start_date_param)
     end_date = parse_date_param(end_date_param)
 
-    # ---------------- BANK POS CREDITS ----------------
-    deposits = execute_query(
+    # ---------------- PREVIOUS DEPÓSITO ----------------
+    prev_rows = cached_query(
         """
-        SELECT transaction_date, description, amount
+        SELECT MAX(transaction_date) AS prev_date
         FROM bank_transactions
-        WHERE description LIKE '%00992577 POS%'
-        ORDER BY transaction_date
+        WHERE transaction_type = 'credit'
+          AND description LIKE '%DEPOSITO%'
+          AND transaction_date < %s
         """,
-        fetch=True
+        [selected_date],
+        ("bank_transactions",)
     )
-
-    deposits_df = pd.DataFrame(deposits, columns=['transaction_date', 'description', 'amount'])
-
-    if deposits_df.empty:
-        abort(404, "No bank POS transactions found")
-
-    deposits_df['transaction_date'] = pd.to_datetime(deposits_df['transaction_date'])
-    deposits_df['amount'] = deposits_df['amount'].astype(float)
-
-    # ---------------- FIND PREVIOUS DEPÓSITO ----------------
-    deposito_dates = deposits_df.loc[
-        deposits_df['description'].str.upper() == 'DEPOSITO', 'transaction_date'
-    ]
     prev_deposito_date = (
-        deposito_dates[deposito_dates < pd.Timestamp(selected_date)].max()
-        if not deposito_dates.empty
+        pd.Timestamp(prev_rows[0]['prev_date'])
+        if prev_rows and prev_rows[0]['prev_date']
         else pd.Timestamp(selected_date)
     )
 
-    # ---------------- FILTER POS TRANSACTIONS ----------------
-    filtered_df = deposits_df[
-        (deposits_df['transaction_date'] >= prev_deposito_date) &
-        (deposits_df['transaction_date'] <= pd.Timestamp(selected_date)) &
-        (deposits_df['description'].str.upper() != 'DEPOSITO')
-    ].copy()
+    # ---------------- CYCLE QUERIES (run concurrently) ----------------
+    cycle = [prev_deposito_date.date(), selected_date]
+    deposits, tpa_rows, sales_rows = run_concurrently(
+        # bank POS credits of the current cycle only
+        lambda: cached_query(
+            """
+            SELECT transaction_date, description, amount
+            FROM bank_transactions
+            WHERE terminal_id = %s
+              AND transaction_date BETWEEN %s AND %s
+            ORDER BY transaction_date
+            """,
+            [POS_TERMINAL_ID] + cycle,
+            ("bank_transactions",)
+        ),
+        # TPA / TSC data
+        lambda: cached_query(
+            """
+            SELECT data, montante_liquido, tsc
+            FROM tpa_movements
+            WHERE DATE(data) BETWEEN %s AND %s
+            """,
+            cycle,
+            ("tpa_movements",)
+        ),
+        # card sales
+        lambda: cached_query(
+            """
+            SELECT COALESCE(SUM(amount), 0) AS total
+            FROM sales
+            WHERE sale_date BETWEEN %s AND %s
+            AND payment_method LIKE '%Cartão Débito%'
+            """,
+            cycle,
+            ("sales",)
+        ),
+    )
 
+    filtered_df = pd.DataFrame(deposits, columns=['transaction_date', 'description', 'amount'])
+
+    if filtered_df.empty:
+        abort(404, "No bank POS transactions found")
+
+    filtered_df['transaction_date'] = pd.to_datetime(filtered_df['transaction_date'])
+    filtered_df['amount'] = filtered_df['amount'].astype(float)
     filtered_df['credited_date'] = selected_date
-    filtered_df['transaction_date_only'] = pd.to_datetime(filtered_df['transaction_date'].dt.date)
+    filtered_df['transaction_date_only'] = filtered_df['transaction_date'].dt.normalize().astype('datetime64[ns]')
 
     # ---------------- TPA / TSC DATA ----------------
-    tpa_rows = execute_query(
-        """
-        SELECT data, montante_liquido, tsc
-        FROM tpa_movements
-        WHERE DATE(data) BETWEEN %s AND %s
-        """,
-        [prev_deposito_date, selected_date],
-        fetch=True
-    )
-
-    # Handle empty results safely
-    if tpa_rows:
-        tpa_df = pd.DataFrame(tpa_rows)
-        # Rename 'data' to 'transaction_date'
-        if 'data' in tpa_df.columns:
-            tpa_df = tpa_df.rename(columns={'data': 'transaction_date'})
-        tpa_df['transaction_date'] = pd.to_datetime(tpa_df['transaction_date'])
-        tpa_df['transaction_date_only'] = pd.to_datetime(tpa_df['transaction_date'].dt.date)
-        tpa_df[['montante_liquido', 'tsc']] = tpa_df[['montante_liquido', 'tsc']].astype(float)
-    else:
-        tpa_df = pd.DataFrame(columns=['transaction_date', 'montante_liquido', 'tsc', 'transaction_date_only'])
+    tpa_df = pd.DataFrame(tpa_rows, columns=['data', 'montante_liquido', 'tsc'])
+    # TPA rows without a net amount can't be the closest match to anything
+    tpa_df = tpa_df.dropna(subset=['montante_liquido'])
+    tpa_df['transaction_date_only'] = pd.to_datetime(tpa_df['data']).dt.normalize().astype('datetime64[ns]')
+    tpa_df['tsc'] = tpa_df['tsc'].astype(float)
 
     # ---------------- MATCH TSC PER LINE (closest amount per date) ----------------
-    filtered_df['tsc'] = 0.0
+    # One nearest-amount join on integer cents, grouped by date.
+    filtered_df['amount_cents'] = (filtered_df['amount'] * 100).round().astype('int64')
+    tpa_df['amount_cents'] = (tpa_df['montante_liquido'].astype(float) * 100).round().astype('int64')
 
-    for date, group in filtered_df.groupby('transaction_date_only'):
-        tpa_candidates = tpa_df[tpa_df['transaction_date_only'] == date]
-        if not tpa_candidates.empty:
-            for idx, row in group.iterrows():
-                # Find TPA row with closest montante_liquido to bank amount
-                closest_idx = (tpa_candidates['montante_liquido'] - row['amount']).abs().idxmin()
-                filtered_df.at[idx, 'tsc'] = tpa_candidates.at[closest_idx, 'tsc']
+    matched = pd.merge_asof(
+        filtered_df.reset_index().sort_values('amount_cents'),
+        tpa_df[['transaction_date_only', 'amount_cents', 'tsc']].sort_values('amount_cents'),
+        on='amount_cents',
+        by='transaction_date_only',
+        direction='nearest'
+    ).set_index('index').sort_index()
+
+    filtered_df['tsc'] = matched['tsc'].fillna(0.0)
+    filtered_df = filtered_df.drop(columns=['amount_cents'])
 
     # ---------------- CALCULATE TOTALS ----------------
     transactions = filtered_df.to_dict(orient='records')
@@ -711,16 +710,6 @@ def bank_details():
     total_tsc = float(filtered_df['tsc'].sum())
 
     # ---------------- TOTAL SALES ----------------
-    sales_rows = execute_query(
-        """
-        SELECT COALESCE(SUM(amount), 0) AS total
-        FROM sales
-        WHERE sale_date BETWEEN %s AND %s
-        AND payment_method LIKE '%Cartão Débito%'
-        """,
-        [prev_deposito_date, selected_date],
-        fetch=True
-    )
     total_sales = float(sales_rows[0]['total']) if sales_rows else 0.0
 
     # ---------------- DIFFERENCE ----------------
@@ -742,6 +731,7 @@ def bank_details():
     )
 
 @app.route('/deposit_breakdown')
+@timed("pandas")
 def deposit_breakdown():
     deposit_date_param = request.args.get('deposit_date')
     start_date_param = request.args.get('start_date')
@@ -755,19 +745,53 @@ def deposit_breakdown():
     end_date = pd.to_datetime(end_date_param).date() if end_date_param else deposit_date
     start_date1 = start_date - timedelta(days=8)
 
-    # ---------------- BANK TRANSACTIONS ----------------
-    deposits = execute_query(
-        """
-        SELECT transaction_date, description, amount
-        FROM bank_transactions
-        WHERE transaction_type = 'credit'
-          AND DATE(transaction_date) BETWEEN %s AND %s
-        ORDER BY transaction_date
-        """,
-        [start_date1, end_date],
-        fetch=True
+    # ---------------- QUERIES (run concurrently) ----------------
+    deposits, tpa_rows, cash_sales, total_sales_rows = run_concurrently(
+        # bank credits
+        lambda: cached_query(
+            """
+            SELECT transaction_date, description, amount
+            FROM bank_transactions
+            WHERE transaction_type = 'credit'
+              AND DATE(transaction_date) BETWEEN %s AND %s
+            ORDER BY transaction_date
+            """,
+            [start_date1, end_date],
+            ("bank_transactions",)
+        ),
+        # TPA / TSC data
+        lambda: cached_query(
+            """
+            SELECT data, montante, tsc
+            FROM tpa_movements
+            WHERE DATE(data) = %s
+            """,
+            [deposit_date],
+            ("tpa_movements",)
+        ),
+        # cash sales
+        lambda: cached_query(
+            """
+            SELECT sale_date, amount
+            FROM sales
+            WHERE payment_method = 'Dinheiro'
+            """,
+            None,
+            ("sales",)
+        ),
+        # total sales (all methods)
+        lambda: cached_query(
+            """
+            SELECT COALESCE(SUM(amount), 0) AS total
+            FROM sales
+            WHERE sale_date BETWEEN %s AND %s
+            """,
+            [start_date, deposit_date],
+            ("sales",)
+        ),
     )
 
+    # ---------------- BANK TRANSACTIONS ----------------
     df = pd.DataFrame(deposits, columns=['transaction_date', 'description', 'amount'])
 
     if df.empty:
@@ -787,16 +811,6 @@ def deposit_breakdown():
         abort(404, f"No DEPOSITO found on {deposit_date}")
 
     # ---------------- TPA / TSC DATA ----------------
-    tpa_rows = execute_query(
-        """
-        SELECT data, montante, tsc
-        FROM tpa_movements
-        WHERE DATE(data) = %s
-        """,
-        [deposit_date],
-        fetch=True
-    )
-
     tpa_df = pd.DataFrame(tpa_rows, columns=['transaction_date', 'amount', 'tsc'])
     if not tpa_df.empty:
         tpa_df['transaction_date'] = pd.to_datetime(tpa_df['transaction_date']).dt.date
@@ -825,14 +839,6 @@ def deposit_breakdown():
     ]['transaction_date'].max()
 
     # ---------------- CASH SALES ----------------
-    cash_sales = execute_query(
-        """
-        SELECT sale_date, amount
-        FROM sales
-        WHERE payment_method = 'Dinheiro'
-        """,
-        fetch=True
-    )
     cash_df = pd.DataFrame(cash_sales, columns=['sale_date', 'amount'])
     if not cash_df.empty:
         cash_df['sale_date'] = pd.to_datetime(cash_df['sale_date']).dt.date
@@ -852,16 +858,7 @@ def deposit_breakdown():
     total_cash = float(cash_used['amount'].sum())
 
     # ---------------- TOTAL SALES (ALL METHODS) ----------------
-    total_sales_amount = execute_query(
-        """
-        SELECT COALESCE(SUM(amount), 0)
-        FROM sales
-        WHERE sale_date BETWEEN %s AND %s
-        """,
-        [start_date, deposit_date],
-        fetchone=True
-    )[0]
-    total_sales_amount = float(total_sales_amount or 0)
+    total_sales_amount = float(total_sales_rows[0]['total'] or 0)
 
     # ---------------- DIFFERENCE ----------------
     diff = deposito_amount - total_cash
@@ -884,109 +881,102 @@ def deposit_breakdown():
         end_date=end_date
     )
 
-@app.route('/expenses_vs_sales_data', methods=['POST'])
+@app.route('/expenses_vs_sales_data')
 def expenses_vs_sales_data():
     """Return JSON with categories, totals, and chart data for given date range + view."""
-    data = request.form
+    data = request.args
     start_str = data.get("start_date")
     end_str = data.get("end_date")
     view = data.get("view", "monthly")
+    max_points = parse_max_points(data.get("max_points"))
 
     start_date = datetime.strptime(start_str, "%Y-%m-%d").date()
     end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
 
-    # --- Fetch transactions ---
-    transactions = execute_query(
-        """
-        SELECT t.transaction_date AS date,
-               t.description,
-               t.amount,
-               COALESCE(c.category,'Unclassified') AS category
-        FROM bank_transactions t
-        LEFT JOIN debit_classifications c
-            ON t.description LIKE CONCAT('%', c.description_pattern, '%')
-        WHERE t.transaction_type='debit'
-          AND DATE(t.transaction_date) BETWEEN %s AND %s
-        ORDER BY t.transaction_date ASC
-        """,
-        [start_date, end_date],
-        fetch=True
-    )
+    def build():
+        data = build_expenses_view(start_date, end_date, view, max_points)
+        columns = columnar_view(data)
+        return {
+            "categories": data["categories"],
+            "total_amount": data["total_amount"],
+            "total_tx": data["total_tx"],
+            "chart_json": columns["chart"],
+            "category_chart_json": columns["category_chart"],
+            "resolution": data["resolution"]
+        }
 
-    # Aggregate categories
-    df_cat = pd.DataFrame(transactions)
-    if not df_cat.empty:
-        categories_agg = df_cat.groupby('category').agg(
-            tx_count=('amount','count'),
-            total_amount=('amount','sum')
-        ).reset_index().sort_values('total_amount', ascending=False).to_dict(orient='records')
-        total_amount = sum(c['total_amount'] for c in categories_agg)
-        total_tx = sum(c['tx_count'] for c in categories_agg)
-        for c in categories_agg:
-            c['percent'] = (c['total_amount']/total_amount*100) if total_amount else 0
-    else:
-        categories_agg = []
-        total_amount = 0
-        total_tx = 0
-
-    # --- Fetch sales for same period ---
-    sales = execute_query(
-        "SELECT sale_date AS date, amount FROM sales WHERE DATE(sale_date) BETWEEN %s AND %s",
-        [start_date, end_date],
-        fetch=True
-    )
+    return conditional_json(CUBE_TABLES, ["expenses_vs_sales", start_date, end_date, view, max_points], build)
 
-    # --- Prepare Plotly chart data ---
-    df_exp = pd.DataFrame(transactions)
-    df_sales = pd.DataFrame(sales)
+@app.route('/expenses_transactions')
+def expenses_transactions():
+    """
+    One page of a category's debits for the transactions modal:
+    ?category=&start_date=&end_date=&sort=date|amount&order=asc|desc&cursor=
+    Pass the returned next_cursor to get the following page (null = last page).
+    """
+    category = request.args.get("category")
+    sort = request.args.get("sort", "date")
+    order = request.args.get("order", "asc")
+    if not category or sort not in ("date", "amount") or order not in ("asc", "desc"):
+        abort(400, "Expected category, sort=date|amount and order=asc|desc")
 
-    if not df_exp.empty:
-        df_exp['date'] = pd.to_datetime(df_exp['date'])
-        df_exp['amount'] = df_exp['amount'].astype(float).abs()
-    else:
-        df_exp = pd.DataFrame(columns=['date','amount'])
+    start_date = datetime.strptime(request.args["start_date"], "%Y-%m-%d").date()
+    end_date = datetime.strptime(request.args["end_date"], "%Y-%m-%d").date()
 
-    if not df_sales.empty:
-        df_sales['date'] = pd.to_datetime(df_sales['date'])
-        df_sales['amount'] = df_sales['amount'].astype(float)
-    else:
-        df_sales = pd.DataFrame(columns=['date','amount'])
-
-    # Group by view
-    if view == "monthly":
-        df_exp['period'] = df_exp['date'].dt.to_period('M').dt.to_timestamp()
-        df_sales['period'] = df_sales['date'].dt.to_period('M').dt.to_timestamp()
-    elif view == "weekly":
-        df_exp['period'] = df_exp['date'].dt.to_period('W').apply(lambda r: r.start_time)
-        df_sales['period'] = df_sales['date'].dt.to_period('W').apply(lambda r: r.start_time)
-    else:
-        df_exp['period'] = df_exp['date']
-        df_sales['period'] = df_sales['date']
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            decode_cursor(cursor, sort)
+        except ValueError:
+            abort(400, "Invalid cursor")
+
+    return transactions_page(
+        category, start_date, end_date,
+        sort=sort,
+        descending=order == "desc",
+        cursor=cursor
+    )
 
-    exp_chart = df_exp.groupby('period')['amount'].sum().reset_index().rename(columns={'amount':'expenses'})
-    sales_chart = df_sales.groupby('period')['amount'].sum().reset_index().rename(columns={'amount':'sales'})
-    merged_chart = pd.merge(exp_chart, sales_chart, left_on='period', right_on='period', how='outer').fillna(0)
-    merged_chart['net'] = merged_chart['sales'] - merged_chart['expenses']
+# ---------------- REPORT DOWNLOAD ----------------
+@app.route('/reports/download/<report>')
+def download_report(report):
+    """Download one report as csv (streamed), parquet or xlsx: ?format=csv|parquet|xlsx"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in REPORT_FORMATS:
+        abort(400, f"Unknown format: {fmt}")
+
+    # SQL-only reports don't need the (slower) reconciliation run
+    sources = {report_slug(t): (t, d) for t, d in REPORT_QUERIES.items()}
+    if report not in sources:
+        sources = {report_slug(t): (t, d) for t, d in build_report_sources().items()}
+    if report not in sources:
+        abort(404, f"Unknown report: {report}")
+
+    title, data = sources[report]
+    download_name = f"{report}.{fmt}"
+
+    if fmt == "csv":
+        return Response(
+            stream_with_context(iter_csv_chunks(data)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={download_name}"}
+        )
 
-    chart_json = merged_chart.to_dict(orient='records')
+    buffer = io.BytesIO()
+    if fmt == "parquet":
+        write_parquet(data, buffer)
+        mimetype = "application/vnd.apache.parquet"
+    else:
+        write_workbook({title: data}, buffer)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    buffer.seek(0)
 
-    return {
-        "categories": categories_agg,
-        "total_amount": total_amount,
-        "total_tx": total_tx,
-        "chart_json": chart_json,
-        "transactions_json": transactions  # optional, for modal
-    }
+    return send_file(buffer, mimetype=mimetype, as_attachment=True, download_name=download_name)
 
 # ----- View page -----
 @app.route('/debit_classifications', methods=['GET'])
 def debit_classifications():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM debit_classifications ORDER BY id")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    rows = cached_query("SELECT * FROM debit_classifications ORDER BY id", None, ("debit_classifications",))
     return render_template('debit_classifications.html', classifications=rows)
 
 @app.route('/category_evolution', methods=['GET'])
@@ -996,19 +986,13 @@ def category_evolution():
     last_month_end = first_of_this_month - timedelta(days=1)
     first_of_last_month = last_month_end.replace(day=1)
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
+    rows = cached_query("""
         SELECT DISTINCT category
         FROM debit_classifications
         WHERE category IS NOT NULL
         ORDER BY category
-    """)
-    categories = [r['category'] for r in cursor.fetchall()]
-
-    cursor.close()
-    conn.close()
+    """, None, ("debit_classifications",))
+    categories = [r['category'] for r in rows]
 
     return render_template(
             "category_evolution.html",
@@ -1017,10 +1001,10 @@ def category_evolution():
             categories=categories
         )
 
-@app.route('/category_evolution_data', methods=['POST'])
+@app.route('/category_evolution_data')
 def category_evolution_data():
     try:
-        data = request.form
+        data = request.args
 
         start_date_str = data.get("start_date")
         end_date_str = data.get("end_date")
@@ -1033,56 +1017,29 @@ def category_evolution_data():
 
         view = data.get('view', 'monthly')
         categories = data.getlist('categories[]')
+        max_points = parse_max_points(data.get('max_points'))
 
         if not categories:
             return jsonify({"series": []})
 
-        if view == "monthly":
-            period_sql = "DATE_FORMAT(t.transaction_date, '%Y-%m-01')"
-        elif view == "weekly":
-            period_sql = "DATE_SUB(DATE(t.transaction_date), INTERVAL WEEKDAY(t.transaction_date) DAY)"
-        else:
-            period_sql = "DATE(t.transaction_date)"
-
-        placeholders = ",".join(["%s"] * len(categories))
-
-        rows = execute_query(
-            f"""
-            SELECT
-                {period_sql} AS period,
-                c.category,
-                SUM(ABS(t.amount)) AS total
-            FROM bank_transactions t
-            JOIN debit_classifications c
-              ON t.description LIKE CONCAT('%', c.description_pattern, '%')
-            WHERE t.transaction_type = 'debit'
-              AND c.category IN ({placeholders})
-              AND DATE(t.transaction_date) BETWEEN %s AND %s
-            GROUP BY period, c.category
-            ORDER BY period
-            """,
-            categories + [start_date, end_date],
-            fetch=True
+        @timed("pandas")
+        def compute_series():
+            labels, totals = get_cube().series(start_date, end_date, view, "debit", categories)
+            keep, resolution = downsample(totals, max_points)
+            x = labels[keep].strftime('%Y-%m-%d').tolist()
+
+            series = [
+                {"name": cat, "x": x, "y": (totals[cat][keep] / 100).tolist()}
+                for cat in categories
+            ]
+            return {"series": series, "resolution": dict(resolution, view=view)}
+
+        key = ("category_evolution", start_date, end_date, view, tuple(categories), max_points)
+        return conditional_json(
+            CUBE_TABLES, list(key),
+            lambda: cached_value(key, CUBE_TABLES, compute_series)
         )
 
-        df = pd.DataFrame(rows, columns=["period","category","total"])
-
-        if df.empty:
-            return jsonify({"series": []})
-
-        df['period'] = pd.to_datetime(df['period'])
-
-        series = []
-        for cat in categories:
-            d = df[df.category == cat]
-            series.append({
-                "name": cat,
-                "x": d['period'].dt.strftime('%Y-%m-%d').tolist(),
-                "y": d['total'].tolist()
-            })
-
-        return jsonify({"series": series})
-
     except Exception as e:
         print("CATEGORY EVOLUTION ERROR:", e)
         return jsonify({"series": [], "error": str(e)})
@@ -1100,10 +1057,12 @@ def add_classification():
         "INSERT INTO debit_classifications (description_pattern, category) VALUES (%s, %s)",
         (description, category)
     )
-    conn.commit()
     new_id = cursor.lastrowid
+    bump_table_versions(cursor, "debit_classifications")
+    conn.commit()
     cursor.close()
     conn.close()
+    invalidate_cube()
     return jsonify({
         'id': new_id,
         'description_pattern': description,
@@ -1121,9 +1080,11 @@ def edit_classification(id):
         "UPDATE debit_classifications SET description_pattern=%s, category=%s WHERE id=%s",
         (description, category, id)
     )
+    bump_table_versions(cursor, "debit_classifications")
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_cube()
     return jsonify({
         'id': id,
         'description_pattern': description,
@@ -1136,9 +1097,11 @@ def delete_classification(id):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM debit_classifications WHERE id=%s", (id,))
+    bump_table_versions(cursor, "debit_classifications")
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_cube()
     return jsonify({'id': id})
 
 tpa_bp = Blueprint("tpa", __name__)
@@ -1157,6 +1120,7 @@ def fix_date(date_str):
     return datetime.strptime(date_str, "%d-%m-%Y").date()
 
 @tpa_bp.route("/upload/tpa", methods=["POST"])
+@named_lock("imports")
 def upload_tpa():
     if "files[]" not in request.files:
         return jsonify({
@@ -1183,27 +1147,31 @@ def upload_tpa():
 
     for file in files:
         rows = 0
+        profile = ImportProfile()
         try:
-            content = file.stream.read().decode("utf-8").splitlines()
+            with profile.stage("decode"):
+                content = file.stream.read().decode("utf-8").splitlines()
 
             for line in content:
                 if not line[:2].isdigit():
                     continue
 
-                parts = line.split(";")
+                with profile.stage("parse_amounts"):
+                    parts = line.split(";")
 
-                data = fix_date(parts[0])
-                tpa = fix_tpa(parts[1])
-                montante = fix_number(parts[4])
-                dc = parts[5].strip()
-                tsc = fix_number(parts[6])
-                mont_liq = fix_number(parts[7])
+                    data = fix_date(parts[0])
+                    tpa = fix_tpa(parts[1])
+                    montante = fix_number(parts[4])
+                    dc = parts[5].strip()
+                    tsc = fix_number(parts[6])
+                    mont_liq = fix_number(parts[7])
 
-                cur.execute("""
-                    INSERT INTO tpa_movements
-                    (data, tpa_number, montante, dc, tsc, montante_liquido)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (data, tpa, montante, dc, tsc, mont_liq))
+                with profile.stage("insert"):
+                    cur.execute("""
+                        INSERT INTO tpa_movements
+                        (data, tpa_number, montante, dc, tsc, montante_liquido)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (data, tpa, montante, dc, tsc, mont_liq))
 
                 rows += 1
                 rows_total += 1
@@ -1215,7 +1183,8 @@ def upload_tpa():
             results.append({
                 "file": file.filename,
                 "status": "ok",
-                "rows": rows
+                "rows": rows,
+                "profile": profile.result()
             })
 
         except Exception as e:
@@ -1223,13 +1192,18 @@ def upload_tpa():
             results.append({
                 "file": file.filename,
                 "status": "error",
-                "error": str(e)
+                "error": str(e),
+                "profile": profile.result()
             })
 
+    bump_table_versions(cur, "tpa_movements")
     db.commit()
     cur.close()
     db.close()
 
+    if min_date and max_date:
+        refresh_daily_reconciliation(min_date, max_date)
+
     return jsonify({
         "status": "success",
         "summary": {
@@ -1238,11 +1212,66 @@ def upload_tpa():
             "files_error": files_error,
             "rows_total": rows_total,
             "min_date": min_date.isoformat() if min_date else None,
-            "max_date": max_date.isoformat() if max_date else None
+            "max_date": max_date.isoformat() if max_date else None,
+            "profile": merge_profiles(r["profile"] for r in results)
         },
         "results": results
     })
 
 
+# ---------------- PRODUCTION SERVING ----------------
+# gunicorn.conf.py preloads this module in the gunicorn master, calls
+# warm_up() and forks the workers from the warmed process. Workers share the
+# warmed pages copy-on-write instead of each paying for them on first use.
+# The master's pid is stored in app.config["SERVER_PID"] in every worker.
+WARM_UP_MODULES = ("import_csv", "import_excel", "import_pdf", "reconciliation")
+
+
+def prepare_database():
+    """
+    Create missing tables, columns and the daily rollup, as main.py's schema
+    stage does: the dashboard may start on a database main.py hasn't
+    migrated yet (e.g. without table_versions).
+    """
+    create_tables()
+    build_daily_reconciliation_if_empty()
+
+
+def warm_up():
+    """
+    Migrate the schema, then load what a worker would otherwise load on its
+    first requests: the URL map and templates compiled, the plotly.js
+    bundle, the importer modules (pdfplumber, ...) and the rollup cube with
+    the classification rules. Database connections opened here are not
+    pooled, so none are left open for the forked workers to inherit.
+    """
+    app.url_map.update()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    ensure_plotly_js()
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+    try:
+        with unpooled():
+            prepare_database()
+            get_cube()
+    except mysql.connector.Error as e:
+        print("Warm-up: database not ready:", e)
+
+
+def reload_workers_for_results(results):
+    """
+    After an import under gunicorn: SIGHUP the master, which re-warms and
+    gracefully replaces every worker, so the workers start from the new data
+    instead of each rebuilding its cube. No-op under the dev server.
+    """
+    master = app.config.get("SERVER_PID")
+    if not (RELOAD_WORKERS_AFTER_IMPORT and master):
+        return
+    if any(r.get("status") == "ok" for r in results):
+        os.kill(master, signal.SIGHUP)
+
+
 if __name__ == '__main__':
+    prepare_database()
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,12 @@
+// Columnar payloads: {field: [values]} -> [{field: value}, ...]
+function fromColumns(columns) {
+    const fields = Object.keys(columns);
+    const length = fields.length ? columns[fields[0]].length : 0;
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        for (const f of fields) row[f] = columns[f][i];
+        rows[i] = row;
+    }
+    return rows;
+}
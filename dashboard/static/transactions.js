@@ -0,0 +1,73 @@
+// Transactions modal: pages of /expenses_transactions loaded on demand.
+// Requires columns.js. Headers with data-sort="date|amount" toggle the order.
+function createTransactionPager({url, tbody, totalCell, moreButton, headers}) {
+    let params = null;
+    let cursor = null;
+    let done = true;
+    let loading = false;
+    let generation = 0;  // bumped by open(): responses of older queries are dropped
+
+    const money = v => Number(v).toLocaleString(undefined, {minimumFractionDigits: 2});
+
+    function appendRow(t) {
+        const tr = tbody.insertRow();
+        tr.insertCell().textContent = t.date;
+        tr.insertCell().textContent = t.description;
+        const amount = tr.insertCell();
+        amount.className = 'text-end';
+        amount.textContent = money(t.amount);
+    }
+
+    async function next() {
+        if (loading || done) return;
+        const token = generation;
+        loading = true;
+        const query = new URLSearchParams(params);
+        if (cursor) query.set('cursor', cursor);
+        try {
+            const page = await fetch(`${url}?${query}`).then(r => r.json());
+            if (token !== generation) return;
+            fromColumns(page.rows).forEach(appendRow);
+            if (totalCell) totalCell.textContent = money(page.total_amount);
+            cursor = page.next_cursor;
+            done = !cursor;
+        } finally {
+            if (token === generation) {
+                loading = false;
+                if (moreButton) moreButton.classList.toggle('d-none', done);
+            }
+        }
+    }
+
+    function open(newParams) {
+        params = Object.assign({sort: 'date', order: 'asc'}, newParams);
+        generation += 1;
+        cursor = null;
+        done = false;
+        loading = false;  // a page still in flight belongs to the old query
+        tbody.innerHTML = '';
+        return next();
+    }
+
+    if (moreButton) moreButton.addEventListener('click', next);
+
+    (headers || []).forEach(th => {
+        th.style.cursor = 'pointer';
+        th.addEventListener('click', () => {
+            if (!params) return;
+            const sort = th.dataset.sort;
+            const order = params.sort === sort && params.order === 'asc' ? 'desc' : 'asc';
+            open(Object.assign({}, params, {sort, order}));
+        });
+    });
+
+    // Load the next page when the scrollable modal body reaches the bottom
+    const scroller = tbody.closest('.modal-body');
+    if (scroller) {
+        scroller.addEventListener('scroll', () => {
+            if (scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 50) next();
+        });
+    }
+
+    return {open, next};
+}
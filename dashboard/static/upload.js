@@ -111,13 +111,29 @@ function setupUploader({ dropZoneId, inputId, fileType, filenameRegex, errorCont
         xhr.upload.onprogress = updateProgress;
 
         xhr.onload = () => {
+            let response;
             try {
-                const response = JSON.parse(xhr.responseText);
-                renderReport(response);
+                response = JSON.parse(xhr.responseText);
             } catch {
                 alert("Unexpected server response");
+                resetProgress();
+                return;
+            }
+            if (xhr.status !== 202) {
+                renderReport(response);
+                resetProgress();
+                return;
             }
+            // Files are saved; the import runs as a background job
             resetProgress();
+            followJob(response, job => {
+                if (job.status === "done") {
+                    renderReport(job.result);
+                } else {
+                    renderReport({ status: "error", message: job.error || "Import failed" });
+                }
+                resetProgress();
+            });
         };
 
         xhr.onerror = () => {
@@ -137,17 +153,73 @@ function showProgress() {
 }
 
 function resetProgress() {
+    setProgress(0);
+}
+
+function setProgress(percent, label) {
     const bar = document.getElementById("uploadProgressBar");
-    bar.style.width = "0%";
-    bar.textContent = "0%";
+    bar.style.width = percent + "%";
+    bar.textContent = label || percent + "%";
 }
 
 function updateProgress(e) {
     if (!e.lengthComputable) return;
-    const percent = Math.round((e.loaded / e.total) * 100);
-    const bar = document.getElementById("uploadProgressBar");
-    bar.style.width = percent + "%";
-    bar.textContent = percent + "%";
+    setProgress(Math.round((e.loaded / e.total) * 100));
+}
+
+/* ---------- Background jobs ---------- */
+
+const JOB_POLL_MS = 1000;
+
+function showJobProgress(job) {
+    const { done, total, current } = job.progress;
+    const percent = total ? Math.round((done / total) * 100) : 0;
+    let label = `Importing ${done}/${total}`;
+    if (current) label += `: ${current}`;
+    setProgress(percent, label);
+}
+
+// Follows a job through Server-Sent Events (polling the status URL when
+// EventSource is unavailable or the stream drops) until it finishes.
+function followJob({ status_url, events_url }, onFinished) {
+    const finished = job => job.status === "done" || job.status === "failed";
+    showProgress();
+
+    const poll = () => {
+        fetch(status_url)
+            .then(r => r.json())
+            .then(job => {
+                showJobProgress(job);
+                if (finished(job)) onFinished(job);
+                else setTimeout(poll, JOB_POLL_MS);
+            })
+            .catch(() => setTimeout(poll, JOB_POLL_MS));
+    };
+
+    if (!window.EventSource) return poll();
+
+    const source = new EventSource(events_url);
+    source.onmessage = e => {
+        const job = JSON.parse(e.data);
+        showJobProgress(job);
+        if (finished(job)) {
+            source.close();
+            onFinished(job);
+        }
+    };
+    source.onerror = () => {
+        source.close();
+        poll();
+    };
+}
+
+// "340 ms, peak 12.5 MB" plus the time of each import stage
+function formatProfile(p) {
+    let text = `${p.total_ms} ms`;
+    if (p.peak_memory_mb != null) text += `, peak ${p.peak_memory_mb} MB`;
+    const stages = Object.entries(p.stages_ms).map(([name, ms]) => `${name} ${ms} ms`);
+    if (stages.length) text += `\n      ${stages.join(" · ")}`;
+    return text;
 }
 
 function renderReport(data) {
@@ -162,6 +234,7 @@ function renderReport(data) {
         output += `Rows imported: ${s.rows_total}\n`;
         if (s.min_date) output += `From: ${s.min_date}\n`;
         if (s.max_date) output += `To: ${s.max_date}\n`;
+        if (s.profile) output += `Import time: ${formatProfile(s.profile)}\n`;
         output += `\n--- File details ---\n`;
 
         data.results.forEach(r => {
@@ -170,6 +243,7 @@ function renderReport(data) {
             } else {
                 output += `✖ ${r.file}: ${r.message}\n`;
             }
+            if (r.profile) output += `    ${formatProfile(r.profile)}\n`;
         });
     } else {
         output = `✖ Upload failed\n\n${data.message}`;
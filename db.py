@@ -1,9 +1,117 @@
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context, ContextVar
+
 import mysql.connector
-from config import MYSQL_CONFIG
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from config import MYSQL_CONFIG, DB_POOL_SIZE, QUERY_FANOUT_WORKERS, IMPORT_LOCK_TIMEOUT
+from request_timing import TimedConnection, current_timings, end_request, start_request, timed
+
+# ---------------- CONNECTION POOL ----------------
+# One pool and one fan-out executor per process: connections and threads
+# must not be shared across fork(), so each is recreated when the pid changes.
+_pool = None
+_pool_pid = None
+_fanout = None
+_fanout_pid = None
+_lock = threading.Lock()
+_in_fanout = ContextVar("in_fanout", default=False)
+_unpooled = ContextVar("unpooled", default=False)
+
+
+def _process_pool():
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _lock:
+            if _pool_pid != os.getpid():
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=f"sales_analysis_{os.getpid()}",
+                    pool_size=DB_POOL_SIZE,
+                    **MYSQL_CONFIG
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _process_fanout():
+    global _fanout, _fanout_pid
+    if _fanout_pid != os.getpid():
+        with _lock:
+            if _fanout_pid != os.getpid():
+                _fanout = ThreadPoolExecutor(max_workers=QUERY_FANOUT_WORKERS, thread_name_prefix="query")
+                _fanout_pid = os.getpid()
+    return _fanout
+
+
+@contextmanager
+def unpooled():
+    """
+    Open dedicated connections (closed after use) in this block instead of
+    creating the process pool, e.g. in a server master before it forks
+    workers: no pooled connections are left open to be inherited.
+    """
+    token = _unpooled.set(True)
+    try:
+        yield
+    finally:
+        _unpooled.reset(token)
+
+
+def _connect(pooled):
+    if not pooled or _unpooled.get():
+        return mysql.connector.connect(**MYSQL_CONFIG)
+    try:
+        return _process_pool().get_connection()
+    except PoolError:
+        # every pooled connection is in use: open a dedicated one
+        return mysql.connector.connect(**MYSQL_CONFIG)
+
+
+def get_connection(pooled=True):
+    """
+    Return a MySQL connection (timed as 'sql' during a dashboard request).
+    pooled=True borrows it from the process pool; close() gives it back.
+    """
+    if current_timings() is None:
+        return _connect(pooled)
+    with timed("sql"):
+        return TimedConnection(_connect(pooled))
+
+
+def run_concurrently(*calls):
+    """
+    Run independent zero-argument callables (usually cached_query lambdas)
+    on the fan-out threads, each with its own pooled connection, and return
+    their results in order; the first exception is re-raised.
+    The caller waits as 'sql', so the request pays for the slowest query
+    instead of the sum of all of them. Nested calls run sequentially.
+    """
+    if len(calls) < 2 or _in_fanout.get():
+        return [fn() for fn in calls]
+
+    parent = current_timings()
+
+    def run(fn):
+        _in_fanout.set(True)
+        child = start_request() if parent is not None else None
+        try:
+            return fn(), child
+        finally:
+            end_request()
+
+    fanout = _process_fanout()
+    with timed("sql"):
+        # a fresh Context per call: request timings are not thread-safe
+        futures = [fanout.submit(Context().run, run, fn) for fn in calls]
+        done = [f.result() for f in futures]
+
+    if parent is not None:
+        parent.queries += sum(child.queries for _, child in done)
+    return [result for result, _ in done]
 
-def get_connection():
-    """Return a new MySQL connection."""
-    return mysql.connector.connect(**MYSQL_CONFIG)
 
 def execute_query(query, params=None, fetch=False):
     """
@@ -31,3 +139,54 @@ def execute_query(query, params=None, fetch=False):
             cursor.close()
         if conn:
             conn.close()
+
+def stream_query(query, params=None, batch_size=1000):
+    """
+    Stream a SELECT from an unbuffered (server-side) cursor.
+    Yields the tuple of column names first, then one row tuple at a time,
+    fetching `batch_size` rows per round trip.
+    """
+    # a dedicated connection: the stream may be abandoned with unread rows
+    conn = get_connection(pooled=False)
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params or ())
+        yield tuple(d[0] for d in cursor.description)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    except mysql.connector.Error as e:
+        print("MySQL error:", e)
+        raise
+    finally:
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass  # unread rows left when the consumer stopped early
+        conn.close()
+
+
+@contextmanager
+def named_lock(name, timeout=IMPORT_LOCK_TIMEOUT):
+    """
+    Hold the MySQL user lock `name` (GET_LOCK) for the block, so work that
+    must not overlap is serialized across processes: dashboard workers,
+    main.py. Waits up to `timeout` seconds, then raises TimeoutError.
+    """
+    # a dedicated connection: the lock belongs to the session holding it
+    conn = get_connection(pooled=False)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+        if cursor.fetchone()[0] != 1:
+            raise TimeoutError(f"Lock '{name}' still held by another process after {timeout}s")
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
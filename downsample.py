@@ -0,0 +1,78 @@
+"""
+Point reduction for chart payloads.
+
+Long daily ranges can carry thousands of points per series; Plotly only
+needs about one point per horizontal pixel. lttb_indices() picks the points
+that keep the visual shape (largest-triangle-three-buckets), downsample()
+applies it to several series sharing one x axis. Only the chart series are
+reduced: table totals are always computed from the full data.
+"""
+import numpy as np
+
+DEFAULT_MAX_POINTS = 1500
+MIN_POINTS = 3
+
+
+def parse_max_points(value):
+    """Target point count from a request value; DEFAULT_MAX_POINTS when missing or invalid."""
+    try:
+        return max(int(value), MIN_POINTS)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_POINTS
+
+
+def lttb_indices(y, target):
+    """
+    Indices of the `target` points of y (x = position) selected by LTTB.
+    First and last points are always kept; returns all indices when
+    len(y) <= target.
+    """
+    n = len(y)
+    if target >= n or target < MIN_POINTS:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    every = (n - 2) / (target - 2)
+
+    keep = np.empty(target, dtype="int64")
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+
+    for i in range(target - 2):
+        # candidates: bucket i; third vertex: the average of bucket i + 1
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_lo = hi
+        next_hi = min(int((i + 2) * every) + 1, n)
+
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+
+    return keep
+
+
+def downsample(series, max_points):
+    """
+    Reduce several series sharing one x axis to at most max_points positions.
+
+    series: {name: 1-D array}, all the same length. Each series gets an equal
+    share of the budget and the union of the selected positions is kept, so
+    every series keeps its peaks. Returns (indices, resolution) where
+    resolution describes what the client receives.
+    """
+    n = max((len(v) for v in series.values()), default=0)
+    if n <= max_points:
+        return np.arange(n), {"method": "full", "points": n, "source_points": n}
+
+    share = max(max_points // max(len(series), 1), MIN_POINTS)
+    keep = np.unique(np.concatenate([lttb_indices(v, share) for v in series.values()]))
+    return keep, {"method": "lttb", "points": len(keep), "source_points": n}
@@ -0,0 +1,114 @@
+"""
+Data behind the Expenses vs Sales pages.
+
+Category totals and chart series come from the in-memory rollup cube
+(O(1) per bucket); the transactions modal pages through the cube's debit
+index via transactions_page(). Long chart series are reduced to max_points
+(downsample.py); totals are always exact. Shared by /expenses_vs_sales,
+/expenses_vs_sales_data, /expenses_drilldown and /expenses_transactions.
+"""
+from rollup_cube import CUBE_TABLES, get_cube
+from downsample import DEFAULT_MAX_POINTS, downsample
+from fast_json import to_columns
+from request_timing import timed
+from query_cache import cached_value
+
+TRANSACTION_FIELDS = ["date", "description", "amount"]
+CHART_FIELDS = ["period", "expenses", "sales", "net"]
+CATEGORY_CHART_FIELDS = ["period", "category", "amount"]
+
+
+# ---------------- AGGREGATION ----------------
+def aggregate_categories(cube, start_date, end_date):
+    """Category rows (largest first) plus total amount and transaction count."""
+    totals = cube.category_totals(start_date, end_date, "debit")
+    total_cents = sum(cents for cents, _ in totals.values())
+    total_tx = sum(count for _, count in totals.values())
+
+    categories = [
+        {
+            "category": category,
+            "tx_count": count,
+            "total_amount": cents / 100,
+            "percent": (cents / total_cents * 100) if total_cents else 0,
+        }
+        for category, (cents, count) in sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)
+    ]
+    return categories, total_cents / 100, total_tx
+
+
+def chart_rows(cube, start_date, end_date, view, max_points=DEFAULT_MAX_POINTS):
+    """Expenses (debits), sales (credits) and net per period, plus the chart resolution."""
+    labels, expenses = cube.series(start_date, end_date, view, "debit")
+    _, sales = cube.series(start_date, end_date, view, "credit")
+
+    keep, resolution = downsample({"expenses": expenses, "sales": sales}, max_points)
+    labels, expenses, sales = labels[keep], expenses[keep], sales[keep]
+
+    rows = [
+        {
+            "period": period.strftime("%Y-%m-%d"),
+            "expenses": e / 100,
+            "sales": s / 100,
+            "net": (s - e) / 100,
+        }
+        for period, e, s in zip(labels, expenses.tolist(), sales.tolist())
+    ]
+    return rows, resolution
+
+
+def category_chart_rows(cube, start_date, end_date, view, categories, max_points=DEFAULT_MAX_POINTS):
+    """Debit totals per period and category (chart filtered by category)."""
+    labels, series = cube.series(start_date, end_date, view, "debit", categories)
+
+    rows = []
+    for category, values in series.items():
+        keep, _ = downsample({category: values}, max_points)
+        rows.extend(
+            {"period": period.strftime("%Y-%m-%d"), "category": category, "amount": cents / 100}
+            for period, cents in zip(labels[keep], values[keep].tolist())
+            if cents
+        )
+    return rows
+
+
+def build_expenses_view(start_date, end_date, view="monthly", max_points=DEFAULT_MAX_POINTS):
+    """Everything the expenses pages need, cached (shared by workers) until CUBE_TABLES change."""
+    return cached_value(
+        ("expenses_view", start_date, end_date, view, max_points),
+        CUBE_TABLES,
+        lambda: compute_expenses_view(start_date, end_date, view, max_points)
+    )
+
+
+@timed("pandas")
+def compute_expenses_view(start_date, end_date, view, max_points):
+    cube = get_cube()
+    categories, total_amount, total_tx = aggregate_categories(cube, start_date, end_date)
+    chart, resolution = chart_rows(cube, start_date, end_date, view, max_points)
+
+    return {
+        "categories": categories,
+        "total_amount": total_amount,
+        "total_tx": total_tx,
+        "chart": chart,
+        "category_chart": category_chart_rows(
+            cube, start_date, end_date, view, [c["category"] for c in categories], max_points
+        ),
+        "resolution": dict(resolution, view=view),
+    }
+
+
+def columnar_view(data):
+    """Chart rows of build_expenses_view() as parallel arrays."""
+    return {
+        "chart": to_columns(data["chart"], CHART_FIELDS),
+        "category_chart": to_columns(data["category_chart"], CATEGORY_CHART_FIELDS),
+    }
+
+
+@timed("pandas")
+def transactions_page(category, start_date, end_date, sort="date", descending=False, cursor=None):
+    """One keyset page of a category's debits for the transactions modal (rows as parallel arrays)."""
+    page = get_cube().debit_page(category, start_date, end_date, sort, descending, cursor)
+    return dict(page, rows=to_columns(page["rows"], TRANSACTION_FIELDS))
@@ -0,0 +1,69 @@
+"""
+JSON encoding for the dashboard.
+
+dumps() serializes Decimal, date/datetime and numpy values without going
+through str(); it uses orjson when installed and falls back to the stdlib
+json module. to_columns() turns a list of row dicts into parallel arrays
+({field: [values]}) so field names are sent once instead of once per row;
+static/columns.js turns them back into rows on the client.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serialize obj to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def dumps(obj):
+    """Serialize obj to a JSON str (for embedding in templates)."""
+    return dumps_bytes(obj).decode()
+
+
+def to_columns(rows, fields=None):
+    """[{a: 1, b: 2}, {a: 3, b: 4}] -> {a: [1, 3], b: [2, 4]}."""
+    if fields is None:
+        fields = list(rows[0]) if rows else []
+    return {f: [r[f] for r in rows] for f in fields}
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider so jsonify() and dict responses use dumps()."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
@@ -0,0 +1,56 @@
+"""
+Production server for the dashboard, run from the repository root:
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py
+
+The app is imported and warmed once in the
+master (dashboard/app.py warm_up) and the workers are forked from it.
+Addresses, worker and thread counts come from config.py; command-line flags
+(-b, -w, --threads) override them. `kill -HUP <master pid>` re-warms the
+master and gracefully replaces the workers; the dashboard sends it after
+every import when RELOAD_WORKERS_AFTER_IMPORT is on.
+
+The development server is still `python dashboard/app.py`.
+"""
+import gc
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from config import SERVER_BIND, SERVER_WORKERS, SERVER_THREADS
+
+wsgi_app = "app:app"
+chdir = ROOT
+pythonpath = os.path.join(ROOT, "dashboard")
+
+bind = SERVER_BIND
+workers = SERVER_WORKERS
+# threads serve concurrent requests, including long-lived job event streams
+worker_class = "gthread"
+threads = SERVER_THREADS
+preload_app = True
+
+
+def _warm_master(server):
+    from app import warm_up
+    warm_up()
+    # keep the warmed objects out of the collector, so collections in the
+    # workers don't touch (and un-share) their copy-on-write pages
+    gc.freeze()
+    server.log.info("Dashboard caches warmed")
+
+
+def when_ready(server):
+    _warm_master(server)
+
+
+def on_reload(server):
+    gc.unfreeze()
+    _warm_master(server)
+
+
+def post_fork(server, worker):
+    server.app.wsgi().config["SERVER_PID"] = server.pid
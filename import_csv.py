@@ -3,6 +3,9 @@ import re
 import pandas as pd
 from io import StringIO
 from db import get_connection
+from daily_rollup import refresh_for_results
+from versions import bump_table_versions
+from import_profile import ImportProfile
 from unidecode import unidecode
 
 zonesoft_link = 'https://zsbmsv2.zonesoft.org/#!/rpt-tp-valores-dia'
@@ -27,6 +30,15 @@ def clean_tpa_number(s):
     digits = re.sub(r"\D", "", s)
     return digits if digits else None
 
+# ----------------------------
+# POS terminal id from bank description: "... 00992577 POS VENDAS" → "00992577"
+# ----------------------------
+TERMINAL_ID_RE = re.compile(r"(\d+) POS")
+
+def extract_terminal_id(description):
+    match = TERMINAL_ID_RE.search(description or "")
+    return match.group(1) if match else None
+
 # ----------------------------
 # Parse Portuguese-formatted / TPA amounts
 # ----------------------------
@@ -73,19 +85,25 @@ def parse_tpa_amount(s):
 # ----------------------------
 # Detect start of transaction table in CGD or similar CSVs
 # ----------------------------
-def find_transaction_table_start(file_path):
+def read_statement_lines(file_path):
     with open(file_path, "rb") as f:
         raw_bytes = f.read()
     raw_bytes = raw_bytes.replace(b"\x00", b"").replace(b"\x0c", b"\n")
     text = raw_bytes.decode("cp1252", errors="replace")
-    lines = text.splitlines()
+    return text.splitlines()
+
+def find_header_row(lines):
     for i, line in enumerate(lines):
         normalized = normalize_text(line)
         if "data" in normalized and "montante" in normalized and (
             "descricao" in normalized or "mov" in normalized
         ):
-            return i, lines
-    return None, lines
+            return i
+    return None
+
+def find_transaction_table_start(file_path):
+    lines = read_statement_lines(file_path)
+    return find_header_row(lines), lines
 
 # ----------------------------
 # Debit / credit auto-detection
@@ -161,65 +179,79 @@ def import_bank_csvs(folder_path):
             continue
 
         file_path = os.path.join(folder_path, filename)
+        profile = ImportProfile()
 
         try:
-            header_row, lines = find_transaction_table_start(file_path)
+            with profile.stage("decode"):
+                lines = read_statement_lines(file_path)
+            with profile.stage("detect_header"):
+                header_row = find_header_row(lines)
             if header_row is None:
-                results.append({"file": filename, "status": "error", "message": "No transaction table found"})
+                results.append({"file": filename, "status": "error", "message": "No transaction table found",
+                                "profile": profile.result()})
                 continue
 
-            csv_text = "\n".join(lines[header_row:])
-            df = pd.read_csv(StringIO(csv_text), sep=";", header=0, dtype=str, engine="python", on_bad_lines="skip")
-            df.columns = df.columns.str.lower().str.strip().str.replace(".", "", regex=False)
-            if "dc" in df.columns:
-                df["dc"] = df["dc"].astype(str).str.strip().str.upper()
-
-            df = df.rename(columns={
-                "data mov": "movement_date",
-                "data-valor": "value_date",
-                "descrição": "description",
-                "montante": "amount",
-                "saldo contabilístico após movimento": "balance",
-            })
+            with profile.stage("read_csv"):
+                csv_text = "\n".join(lines[header_row:])
+                df = pd.read_csv(StringIO(csv_text), sep=";", header=0, dtype=str, engine="python", on_bad_lines="skip")
+                df.columns = df.columns.str.lower().str.strip().str.replace(".", "", regex=False)
+                if "dc" in df.columns:
+                    df["dc"] = df["dc"].astype(str).str.strip().str.upper()
+
+                df = df.rename(columns={
+                    "data mov": "movement_date",
+                    "data-valor": "value_date",
+                    "descrição": "description",
+                    "montante": "amount",
+                    "saldo contabilístico após movimento": "balance",
+                })
 
             if "movement_date" not in df.columns or "amount" not in df.columns:
-                results.append({"file": filename, "status": "error", "message": "Missing required columns (movement_date, amount)"})
+                results.append({"file": filename, "status": "error", "message": "Missing required columns (movement_date, amount)",
+                                "profile": profile.result()})
                 continue
 
-            df["movement_date"] = pd.to_datetime(df["movement_date"], dayfirst=True, errors="coerce")
-            df["value_date"] = pd.to_datetime(df["value_date"], dayfirst=True, errors="coerce")
-            df["amount"] = df["amount"].apply(parse_tpa_amount)
-            df["description"] = df.get("description", "").fillna("").astype(str)
-            df = df.dropna(subset=["movement_date", "amount"])
+            with profile.stage("parse_amounts"):
+                df["movement_date"] = pd.to_datetime(df["movement_date"], dayfirst=True, errors="coerce")
+                df["value_date"] = pd.to_datetime(df["value_date"], dayfirst=True, errors="coerce")
+                df["amount"] = df["amount"].apply(parse_tpa_amount)
+                df["description"] = df.get("description", "").fillna("").astype(str)
+                df = df.dropna(subset=["movement_date", "amount"])
             if df.empty:
-                results.append({"file": filename, "status": "error", "message": "No valid transactions"})
+                results.append({"file": filename, "status": "error", "message": "No valid transactions",
+                                "profile": profile.result()})
                 continue
 
-            df = apply_debit_credit_sign(df)
-            df["transaction_type"] = df["amount"].apply(lambda x: "debit" if x < 0 else "credit")
+            with profile.stage("infer_sign"):
+                df = apply_debit_credit_sign(df)
+                df["transaction_type"] = df["amount"].apply(lambda x: "debit" if x < 0 else "credit")
 
             inserted = 0
-            for _, row in df.iterrows():
-                cursor.execute(
-                    """
-                    INSERT INTO bank_transactions
-                        (movement_date, transaction_date, description, amount, transaction_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        description = VALUES(description),
-                        amount = VALUES(amount),
-                        transaction_type = VALUES(transaction_type),
-                        transaction_date = VALUES(transaction_date)
-                    """,
-                    (row["movement_date"].date(),
-                     row["value_date"].date() if not pd.isna(row["value_date"]) else None,
-                     row["description"][:500],
-                     row["amount"],
-                     row["transaction_type"])
-                )
-                inserted += 1
-
-            conn.commit()
+            with profile.stage("insert"):
+                for _, row in df.iterrows():
+                    cursor.execute(
+                        """
+                        INSERT INTO bank_transactions
+                            (movement_date, transaction_date, description, amount, transaction_type, terminal_id)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            description = VALUES(description),
+                            amount = VALUES(amount),
+                            transaction_type = VALUES(transaction_type),
+                            transaction_date = VALUES(transaction_date),
+                            terminal_id = VALUES(terminal_id)
+                        """,
+                        (row["movement_date"].date(),
+                         row["value_date"].date() if not pd.isna(row["value_date"]) else None,
+                         row["description"][:500],
+                         row["amount"],
+                         row["transaction_type"],
+                         extract_terminal_id(row["description"]))
+                    )
+                    inserted += 1
+
+                bump_table_versions(cursor, "bank_transactions")
+                conn.commit()
             results.append({
                 "file": filename,
                 "status": "ok",
@@ -227,13 +259,19 @@ def import_bank_csvs(folder_path):
                 "rows": inserted,
                 "min_date": df["movement_date"].min().date().isoformat(),
                 "max_date": df["movement_date"].max().date().isoformat(),
+                # the rollup cube is keyed by transaction_date (value date);
+                # None when some rows had no value date
+                "transaction_min_date": None if df["value_date"].isna().any() else df["value_date"].min().date().isoformat(),
+                "transaction_max_date": None if df["value_date"].isna().any() else df["value_date"].max().date().isoformat(),
+                "profile": profile.result(),
             })
 
         except Exception as e:
-            results.append({"file": filename, "status": "error", "message": str(e)})
+            results.append({"file": filename, "status": "error", "message": str(e), "profile": profile.result()})
 
     cursor.close()
     conn.close()
+    refresh_for_results(results)
     return results
 
 # ----------------------------
@@ -290,36 +328,43 @@ def import_single_tpa_csv(file_path):
         except:
             return None
 
+    profile = ImportProfile()
+
     try:
         # --- Read raw file ---
-        with open(file_path, "rb") as f:
-            raw = f.read()
-        raw = raw.replace(b"\x00", b"")
-        text = raw.decode("cp1252", errors="replace")
-        lines = text.splitlines()
+        with profile.stage("decode"):
+            with open(file_path, "rb") as f:
+                raw = f.read()
+            raw = raw.replace(b"\x00", b"")
+            text = raw.decode("cp1252", errors="replace")
+            lines = text.splitlines()
 
         # --- Detect header line ---
-        header_index = None
-        for i, line in enumerate(lines):
-            n = normalize_text(line)
-            if "data" in n and "montante" in n and "tpa" in n:
-                header_index = i
-                break
+        with profile.stage("detect_header"):
+            header_index = None
+            for i, line in enumerate(lines):
+                n = normalize_text(line)
+                if "data" in n and "montante" in n and "tpa" in n:
+                    header_index = i
+                    break
         if header_index is None:
-            return {"file": filename, "status": "error", "message": "TPA table header not found"}
+            return {"file": filename, "status": "error", "message": "TPA table header not found",
+                    "profile": profile.result()}
 
         # --- Preprocess CSV lines ---
-        fixed_lines = preprocess_lines(lines[header_index:])
-        csv_text = "\n".join(fixed_lines)
-        df = pd.read_csv(StringIO(csv_text), sep=";", dtype=str, engine="python", on_bad_lines="skip", skip_blank_lines=True)
+        with profile.stage("read_csv"):
+            fixed_lines = preprocess_lines(lines[header_index:])
+            csv_text = "\n".join(fixed_lines)
+            df = pd.read_csv(StringIO(csv_text), sep=";", dtype=str, engine="python", on_bad_lines="skip", skip_blank_lines=True)
 
-        # --- Normalize columns ---
-        df.columns = [normalize_text(c) for c in df.columns]
+            # --- Normalize columns ---
+            df.columns = [normalize_text(c) for c in df.columns]
 
         # --- Detect TPA column ---
         tpa_cols = [c for c in df.columns if "tpa" in c]
         if not tpa_cols:
-            return {"file": filename, "status": "error", "message": "TPA column not found"}
+            return {"file": filename, "status": "error", "message": "TPA column not found",
+                    "profile": profile.result()}
         tpa_col = tpa_cols[0]
 
         # --- Column mapping ---
@@ -334,54 +379,58 @@ def import_single_tpa_csv(file_path):
         df = df.rename(columns={k: v for k, v in col_map.items() if k in df.columns})
 
         # --- Parse fields ---
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], dayfirst=True, errors="coerce")
-        df["tpa_number"] = df["tpa_number"].apply(clean_tpa_number)
-        df["montante"] = df["montante"].apply(parse_tpa_amount)
-
-        # Default numeric columns to 0
-        for col in ["tsc", "montante_liquido"]:
-            if col in df.columns:
-                df[col] = df[col].apply(parse_tpa_amount).fillna(0)
-
-        # --- Keep valid rows ---
-        df = df.dropna(subset=["date", "montante"])
+        with profile.stage("parse_amounts"):
+            if "date" in df.columns:
+                df["date"] = pd.to_datetime(df["date"], dayfirst=True, errors="coerce")
+            df["tpa_number"] = df["tpa_number"].apply(clean_tpa_number)
+            df["montante"] = df["montante"].apply(parse_tpa_amount)
+
+            # Default numeric columns to 0
+            for col in ["tsc", "montante_liquido"]:
+                if col in df.columns:
+                    df[col] = df[col].apply(parse_tpa_amount).fillna(0)
+
+            # --- Keep valid rows ---
+            df = df.dropna(subset=["date", "montante"])
         if df.empty:
-            return {"file": filename, "status": "error", "message": "No valid TPA rows found after parsing"}
+            return {"file": filename, "status": "error", "message": "No valid TPA rows found after parsing",
+                    "profile": profile.result()}
 
         # --- Insert into DB ---
-        conn = get_connection()
-        cursor = conn.cursor()
-        inserted = 0
-
-        for _, row in df.iterrows():
-            cursor.execute(
-                """
-                INSERT INTO tpa_movements
-                (data, tpa_number, montante, dc, tsc, montante_liquido)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    montante = VALUES(montante),
-                    dc = VALUES(dc),
-                    tsc = VALUES(tsc),
-                    montante_liquido = VALUES(montante_liquido)
-                """,
-                (
-                    row["date"].date(),
-                    row.get("tpa_number"),
-                    row["montante"],
-                    row.get("dc"),
-                    row.get("tsc"),
-                    row.get("montante_liquido")
+        with profile.stage("insert"):
+            conn = get_connection()
+            cursor = conn.cursor()
+            inserted = 0
+
+            for _, row in df.iterrows():
+                cursor.execute(
+                    """
+                    INSERT INTO tpa_movements
+                    (data, tpa_number, montante, dc, tsc, montante_liquido)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        montante = VALUES(montante),
+                        dc = VALUES(dc),
+                        tsc = VALUES(tsc),
+                        montante_liquido = VALUES(montante_liquido)
+                    """,
+                    (
+                        row["date"].date(),
+                        row.get("tpa_number"),
+                        row["montante"],
+                        row.get("dc"),
+                        row.get("tsc"),
+                        row.get("montante_liquido")
+                    )
                 )
-            )
-            inserted += 1
+                inserted += 1
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            bump_table_versions(cursor, "tpa_movements")
+            conn.commit()
+            cursor.close()
+            conn.close()
 
-        return {
+        result = {
             "file": filename,
             "status": "ok",
             "rows": inserted,
@@ -389,9 +438,13 @@ def import_single_tpa_csv(file_path):
             "min_date": df["date"].min().date().isoformat(),
             "max_date": df["date"].max().date().isoformat(),
         }
+        with profile.stage("rollup"):
+            refresh_for_results([result])
+        result["profile"] = profile.result()
+        return result
 
     except Exception as e:
-        return {"file": filename, "status": "error", "message": str(e)}
+        return {"file": filename, "status": "error", "message": str(e), "profile": profile.result()}
 
 # ----------------------------
 # Import single bank CSV
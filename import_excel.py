@@ -1,6 +1,9 @@
 import os
 import pandas as pd
 from db import get_connection
+from daily_rollup import refresh_for_results
+from versions import bump_table_versions
+from import_profile import ImportProfile
 
 
 def parse_euro_amount(value):
@@ -62,51 +65,56 @@ def import_sales_excels(folder_path):
             continue
 
         file_path = os.path.join(folder_path, filename)
+        profile = ImportProfile()
 
         try:
-            df = pd.read_excel(
-                file_path,
-                converters={
-                    3: lambda v: str(v)  # Amount column ONLY
-                }
-            )
+            with profile.stage("read_excel"):
+                df = pd.read_excel(
+                    file_path,
+                    converters={
+                        3: lambda v: str(v)  # Amount column ONLY
+                    }
+                )
 
         except Exception as e:
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": f"Failed to read Excel: {e}"
+                "message": f"Failed to read Excel: {e}",
+                "profile": profile.result(),
             })
             continue
 
-        df = df.fillna("")
-        rows_to_insert = []
-
-        for _, row in df.iterrows():
-            # Column B → Date
-            sale_date = pd.to_datetime(row.iloc[1], dayfirst=True, errors="coerce")
-            if pd.isna(sale_date):
-                continue
-
-            # Column C → Payment method
-            payment_method = row.iloc[2].strip()
-            if not payment_method:
-                continue
-
-            # Column D → Amount
-            amount = parse_pt_amount(row.iloc[3])
-            if amount is None:
-                continue
-#            amount = amount / 1000
-            rows_to_insert.append(
-                (sale_date.date(), payment_method, amount)
-            )
+        with profile.stage("parse_rows"):
+            df = df.fillna("")
+            rows_to_insert = []
+
+            for _, row in df.iterrows():
+                # Column B → Date
+                sale_date = pd.to_datetime(row.iloc[1], dayfirst=True, errors="coerce")
+                if pd.isna(sale_date):
+                    continue
+
+                # Column C → Payment method
+                payment_method = row.iloc[2].strip()
+                if not payment_method:
+                    continue
+
+                # Column D → Amount
+                amount = parse_pt_amount(row.iloc[3])
+                if amount is None:
+                    continue
+#                amount = amount / 1000
+                rows_to_insert.append(
+                    (sale_date.date(), payment_method, amount)
+                )
 
         if not rows_to_insert:
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": "No valid sales rows"
+                "message": "No valid sales rows",
+                "profile": profile.result(),
             })
             continue
 
@@ -114,18 +122,20 @@ def import_sales_excels(folder_path):
         max_date = max(r[0] for r in rows_to_insert)
 
         try:
-            for sale_date, payment_method, amount in rows_to_insert:
-                cursor.execute(
-                    """
-                    INSERT INTO sales (sale_date, payment_method, amount)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        amount = VALUES(amount)
-                    """,
-                    (sale_date, payment_method, amount),
-                )
-
-            conn.commit()
+            with profile.stage("insert"):
+                for sale_date, payment_method, amount in rows_to_insert:
+                    cursor.execute(
+                        """
+                        INSERT INTO sales (sale_date, payment_method, amount)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            amount = VALUES(amount)
+                        """,
+                        (sale_date, payment_method, amount),
+                    )
+
+                bump_table_versions(cursor, "sales")
+                conn.commit()
 
             results.append({
                 "file": filename,
@@ -133,6 +143,7 @@ def import_sales_excels(folder_path):
                 "rows": len(rows_to_insert),
                 "min_date": min_date.isoformat(),
                 "max_date": max_date.isoformat(),
+                "profile": profile.result(),
             })
 
         except Exception as e:
@@ -140,11 +151,13 @@ def import_sales_excels(folder_path):
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": str(e)
+                "message": str(e),
+                "profile": profile.result(),
             })
 
     cursor.close()
     conn.close()
+    refresh_for_results(results)
     return results
 
 def import_single_sales_excel(file_path):
@@ -3,6 +3,9 @@ import re
 import pdfplumber
 import pandas as pd
 from db import get_connection
+from daily_rollup import refresh_for_results
+from versions import bump_table_versions
+from import_profile import ImportProfile
 
 
 def parse_pt_amount(value):
@@ -44,52 +47,56 @@ def import_sales_pdfs(folder_path):
 
         file_path = os.path.join(folder_path, filename)
         rows_to_insert = []
+        profile = ImportProfile()
 
         try:
             with pdfplumber.open(file_path) as pdf:
                 for page in pdf.pages:
-                    text = page.extract_text()
+                    with profile.stage("extract_text"):
+                        text = page.extract_text()
                     if not text:
                         continue
 
-                    for line in text.split("\n"):
-                        # Match lines like:
-                        # 1 01-12-2025 Dinheiro 542,420€
-                        match = re.match(
-                            r"\d+\s+"
-                            r"(\d{2}-\d{2}-\d{4})\s+"
-                            r"(.+?)\s+"
-                            r"([\d\s.,]+)€",
-                            line
-                        )
+                    with profile.stage("parse_rows"):
+                        for line in text.split("\n"):
+                            # Match lines like:
+                            # 1 01-12-2025 Dinheiro 542,420€
+                            match = re.match(
+                                r"\d+\s+"
+                                r"(\d{2}-\d{2}-\d{4})\s+"
+                                r"(.+?)\s+"
+                                r"([\d\s.,]+)€",
+                                line
+                            )
 
-                        if not match:
-                            continue
+                            if not match:
+                                continue
 
-                        sale_date_raw, payment_method, amount_raw = match.groups()
+                            sale_date_raw, payment_method, amount_raw = match.groups()
 
-                        sale_date = pd.to_datetime(
-                            sale_date_raw,
-                            dayfirst=True,
-                            errors="coerce"
-                        )
+                            sale_date = pd.to_datetime(
+                                sale_date_raw,
+                                dayfirst=True,
+                                errors="coerce"
+                            )
 
-                        if pd.isna(sale_date):
-                            continue
+                            if pd.isna(sale_date):
+                                continue
 
-                        amount = parse_pt_amount(amount_raw)
-                        if amount is None:
-                            continue
+                            amount = parse_pt_amount(amount_raw)
+                            if amount is None:
+                                continue
 
-                        rows_to_insert.append(
-                            (sale_date.date(), payment_method.strip(), amount)
-                        )
+                            rows_to_insert.append(
+                                (sale_date.date(), payment_method.strip(), amount)
+                            )
 
         except Exception as e:
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": f"Failed to read PDF: {e}"
+                "message": f"Failed to read PDF: {e}",
+                "profile": profile.result(),
             })
             continue
 
@@ -97,7 +104,8 @@ def import_sales_pdfs(folder_path):
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": "No valid sales rows"
+                "message": "No valid sales rows",
+                "profile": profile.result(),
             })
             continue
 
@@ -105,18 +113,20 @@ def import_sales_pdfs(folder_path):
         max_date = max(r[0] for r in rows_to_insert)
 
         try:
-            for sale_date, payment_method, amount in rows_to_insert:
-                cursor.execute(
-                    """
-                    INSERT INTO sales (sale_date, payment_method, amount)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        amount = VALUES(amount)
-                    """,
-                    (sale_date, payment_method, amount),
-                )
-
-            conn.commit()
+            with profile.stage("insert"):
+                for sale_date, payment_method, amount in rows_to_insert:
+                    cursor.execute(
+                        """
+                        INSERT INTO sales (sale_date, payment_method, amount)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            amount = VALUES(amount)
+                        """,
+                        (sale_date, payment_method, amount),
+                    )
+
+                bump_table_versions(cursor, "sales")
+                conn.commit()
 
             results.append({
                 "file": filename,
@@ -124,6 +134,7 @@ def import_sales_pdfs(folder_path):
                 "rows": len(rows_to_insert),
                 "min_date": min_date.isoformat(),
                 "max_date": max_date.isoformat(),
+                "profile": profile.result(),
             })
 
         except Exception as e:
@@ -131,11 +142,13 @@ def import_sales_pdfs(folder_path):
             results.append({
                 "file": filename,
                 "status": "error",
-                "message": str(e)
+                "message": str(e),
+                "profile": profile.result(),
             })
 
     cursor.close()
     conn.close()
+    refresh_for_results(results)
     return results
 
 
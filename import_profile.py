@@ -0,0 +1,114 @@
+"""
+Per-file import profiling.
+
+An ImportProfile times the stages of one file's import (decoding, header
+detection, read_csv, amount parsing, sign inference, inserts, ...) and
+records the peak memory traced while it ran. Importers add
+profile.result() to each per-file result dict as "profile";
+merge_profiles() sums several of them for the upload summary.
+
+Peak memory is the largest resident set size (RSS) sampled when the profile
+starts and after each stage: cheap, process-wide, and blind to a short spike
+inside a stage. IMPORT_TRACE_MEMORY switches to tracemalloc (Python and numpy
+allocations, exact peak), which makes allocation-heavy imports several times
+slower (and inflates the stage times reported next to it). tracemalloc is
+process-wide, so profiles running at the same time (a job thread and an
+upload_tpa request) share one trace: it starts with the first of them and
+stops with the last, and each peak covers both.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from config import IMPORT_TRACE_MEMORY
+
+_trace_lock = threading.Lock()
+_tracers = 0            # profiles currently tracing
+_started_here = False   # tracemalloc was started by the first of them
+
+
+def _rss_bytes():
+    """Current RSS from /proc; the process's peak RSS elsewhere; None on Windows."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024  # bytes on macOS, KiB on Linux
+
+
+class ImportProfile:
+    def __init__(self):
+        global _tracers, _started_here
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.peak_rss = _rss_bytes()
+        self.tracing = IMPORT_TRACE_MEMORY
+        if self.tracing:
+            with _trace_lock:
+                if _tracers == 0:
+                    _started_here = not tracemalloc.is_tracing()
+                    if _started_here:
+                        tracemalloc.start()
+                    else:
+                        tracemalloc.reset_peak()
+                _tracers += 1
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to stage `name` (stages can repeat)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+            self._sample_rss()
+
+    def _sample_rss(self):
+        rss = _rss_bytes()
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def result(self):
+        """{stages_ms, total_ms, peak_memory_mb}; the last tracing profile stops tracemalloc."""
+        global _tracers
+        self._sample_rss()
+        peak = self.peak_rss
+        if self.tracing:
+            with _trace_lock:
+                peak = tracemalloc.get_traced_memory()[1]
+                _tracers -= 1
+                if _tracers == 0 and _started_here:
+                    tracemalloc.stop()
+            self.tracing = False
+        return {
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "peak_memory_mb": round(peak / 2 ** 20, 1) if peak is not None else None,
+        }
+
+
+def merge_profiles(profiles):
+    """Stage and total times summed over several results, peak memory the largest."""
+    stages = {}
+    total = 0.0
+    peaks = []
+    for p in profiles:
+        for name, ms in p["stages_ms"].items():
+            stages[name] = round(stages.get(name, 0.0) + ms, 1)
+        total += p["total_ms"]
+        if p["peak_memory_mb"] is not None:
+            peaks.append(p["peak_memory_mb"])
+    return {
+        "stages_ms": stages,
+        "total_ms": round(total, 1),
+        "peak_memory_mb": max(peaks) if peaks else None,
+    }
@@ -0,0 +1,258 @@
+"""
+In-process background jobs for the dashboard.
+
+Imports and dashboard actions run on a persistent thread pool inside the
+dashboard process (pandas, pdfplumber, ... stay loaded between jobs), so an
+HTTP request only saves its files, submits a job and returns the job id.
+A job function receives its Job and reports per-file progress with
+job.file_done(); clients poll job.to_dict() or wait on job.wait() for the
+next change (the Server-Sent Events route does the latter).
+
+Under a multi-process server (gunicorn.conf.py) a status or events request
+can reach another worker than the one running the job, so every change is
+also written to a SQLite file shared by the workers on the host
+(JOB_STATE_PATH); get_job() falls back to a read-only view of that state.
+A queued or running job whose worker has exited (restart, reload, crash) is
+reported as failed, so clients following it stop waiting.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_WORKERS, JOB_STATE_PATH
+
+# finished jobs are kept this long for late status requests
+JOB_TTL_SECONDS = 3600
+
+# how often a job owned by another worker is re-read while waiting (seconds)
+REMOTE_POLL_SECONDS = 0.5
+
+_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class Job:
+    def __init__(self, kind, files):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> done | failed
+        self.files = list(files)
+        self.current = None
+        self.results = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.revision = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        """Set fields and wake up everyone waiting for the next revision."""
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.revision += 1
+            self.changed.notify_all()
+        _store.save(self.to_dict(), self.finished)
+
+    def start_file(self, name):
+        self.update(current=name)
+
+    def file_done(self, result):
+        """Record the result dict of one file."""
+        with self.changed:
+            self.results.append(result)
+            self.current = None
+            self.revision += 1
+            self.changed.notify_all()
+        _store.save(self.to_dict(), self.finished)
+
+    def wait(self, revision, timeout):
+        """Block until revision changes (or timeout); returns the current revision."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.revision != revision, timeout)
+            return self.revision
+
+    def to_dict(self):
+        with self.changed:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "revision": self.revision,
+                "progress": {
+                    "done": len(self.results),
+                    "total": len(self.files),
+                    "current": self.current,
+                },
+                "results": list(self.results),
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class RemoteJob:
+    """Read-only view of a job running in another worker process."""
+
+    def __init__(self, state):
+        self.id = state["id"]
+        self.state = state
+
+    def to_dict(self):
+        return self.state
+
+    def wait(self, revision, timeout):
+        deadline = time.monotonic() + timeout
+        while self.state["revision"] == revision and time.monotonic() < deadline:
+            time.sleep(min(REMOTE_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            self.state = _store.load(self.id) or self.state
+        return self.state["revision"]
+
+
+# ---------------- SHARED STATE ----------------
+def _process_alive(pid):
+    """
+    Whether the worker that stored a job still runs it. Jobs of this process
+    are in _jobs, so a stored job with our own pid is left over from an
+    earlier process that had the same pid.
+    """
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+class JobStore:
+    """
+    Latest to_dict() of every job, in a SQLite file the dashboard workers
+    share. Store errors are printed and ignored: the owning worker still
+    serves its own jobs from memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    revision INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    finished REAL,
+                    pid INTEGER
+                )
+            """)
+            if "pid" not in [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN pid INTEGER")
+
+    def _conn(self):
+        """One connection per thread and per process, as in query_cache."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def save(self, state, finished):
+        """Store the state of a job run by this process."""
+        try:
+            with self._conn() as conn:
+                conn.execute("""
+                    INSERT INTO jobs (id, revision, state, finished, pid) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        revision = excluded.revision, state = excluded.state,
+                        finished = excluded.finished, pid = excluded.pid
+                    WHERE excluded.revision > jobs.revision
+                """, (state["id"], state["revision"], json.dumps(state, default=str), finished, os.getpid()))
+        except sqlite3.Error as e:
+            print("Job state error:", e)
+
+    def load(self, job_id):
+        """
+        The stored state of a job this process doesn't run (None if unknown);
+        an unfinished job whose process is gone is marked failed first.
+        """
+        try:
+            row = self._conn().execute("SELECT state, pid FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            print("Job state error:", e)
+            return None
+        if row is None:
+            return None
+
+        state, pid = json.loads(row[0]), row[1]
+        if state["status"] in ("queued", "running") and not _process_alive(pid):
+            progress = dict(state["progress"], current=None)
+            state = dict(state, status="failed", error="The worker running this job stopped before it finished",
+                         progress=progress, revision=state["revision"] + 1)
+            self.save(state, time.time())
+        return state
+
+    def prune(self, cutoff):
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print("Job state error:", e)
+
+
+_store = JobStore(JOB_STATE_PATH)
+
+
+def _run(job, fn):
+    job.update(status="running")
+    try:
+        result = fn(job)
+    except Exception as e:
+        traceback.print_exc()
+        job.update(status="failed", error=str(e), current=None, finished=time.time())
+    else:
+        job.update(status="done", result=result, current=None, finished=time.time())
+
+
+def _prune():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with _jobs_lock:
+        for job_id in [j.id for j in _jobs.values() if j.finished and j.finished < cutoff]:
+            del _jobs[job_id]
+    _store.prune(cutoff)
+
+
+def submit_job(kind, fn, files=()):
+    """Queue fn(job) on the worker pool; returns the Job right away."""
+    _prune()
+    job = Job(kind, files)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _store.save(job.to_dict(), None)
+    _pool.submit(_run, job, fn)
+    return job
+
+
+def get_job(job_id):
+    """
+    The Job with this id, a RemoteJob when another worker runs it, or None
+    when unknown / expired.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        state = _store.load(job_id)
+        if state is not None:
+            job = RemoteJob(state)
+    return job
@@ -1,63 +1,183 @@
-from models import create_tables
-from migrate import migrate_initial_data
-from import_excel import import_sales_excels
-from import_csv import import_bank_csvs
-from classify import classify_debits
-from reports import debit_summary_by_category, monthly_reconciliation, export_report_to_excel
-from reconciliation import reconcile_sales_vs_bank
-from visualize import (
-    plot_daily_reconciliation,
-    plot_debit_categories,
-    run_all_visualizations, plot_monthly_debits, plot_stacked_debit_categories, plot_debit_vs_credit_interactive
-)
-
-from visualize import run_all_visualizations
+import time
 
-if __name__ == "__main__":
-    # Step 1: Create tables
+STARTED = time.perf_counter()
+
+import argparse
+import glob
+import json
+import os
+from config import REPORT_FORMATS
+from pipeline import Stage, run_stages, print_summary
+from versions import folder_hashes, get_table_versions, load_stage_fingerprints, save_stage_fingerprint
+
+SALES_DIR = "data/sales_excels"
+BANK_DIR = "data/bank_csvs"
+REPORTS_BASENAME = "reports/reports"
+CHARTS_MANIFEST = "cache/charts.json"  # files written by the last charts run
+
+# Each stage imports its own modules, so a run only loads what it executes
+# (pandas for the importers, pyarrow/openpyxl for reports, matplotlib,
+# seaborn and plotly for charts). A stage receives {dependency: result}.
+# The *_inputs functions describe what a stage reads; unchanged inputs = skip.
+
+
+# Step 1: Create tables
+def stage_schema(inputs):
+    from models import create_tables
+    from daily_rollup import build_daily_reconciliation_if_empty
     create_tables()
+    build_daily_reconciliation_if_empty()
 
-    # Step 2: Initial debit classification rules
+# Step 2: Initial debit classification rules
+def stage_rules(inputs):
+    from migrate import migrate_initial_data
     migrate_initial_data()
 
-    # Step 3: Import sales from Excel folder
-    import_sales_excels("data/sales_excels")
+# Step 3: Import sales from Excel folder
+# (importers hold the "imports" lock: a dashboard import may run at the same time)
+def stage_import_sales(inputs):
+    from db import named_lock
+    from import_excel import import_sales_excels
+    with named_lock("imports"):
+        return import_sales_excels(SALES_DIR)
 
-    # Step 4: Import bank transactions from CSV folder
-    import_bank_csvs("data/bank_csvs")
+# Step 4: Import bank transactions from CSV folder
+def stage_import_bank(inputs):
+    from db import named_lock
+    from import_csv import import_bank_csvs
+    with named_lock("imports"):
+        return import_bank_csvs(BANK_DIR)
 
-    # Step 5: Classify debits automatically
+# Step 5: Classify debits automatically
+def stage_classify(inputs):
+    from classify import classify_debits
     classify_debits()
 
-    # Step 6: Generate debit summary report
-    debit_summary = debit_summary_by_category()
-    print("Debit summary by category:", debit_summary)
-    export_report_to_excel(debit_summary, "reports/debit_summary.xlsx")
+# Step 6-7: Automatic sales vs bank credit reconciliation
+def stage_reconcile(inputs):
+    from reports import build_report_sources
+    reports = build_report_sources()
+    print("Unmatched sales:", len(reports["Unmatched sales"]))
+    print("Unmatched bank credits:", len(reports["Unmatched bank credits"]))
+    print("Duplicate credits:", len(reports["Duplicate bank credits"]))
+    return reports
 
-    # Step 7: Generate monthly reconciliation report
-    reconciliation = monthly_reconciliation()
-    print("Monthly reconciliation:", reconciliation)
-    export_report_to_excel(reconciliation, "reports/monthly_reconciliation.xlsx")
+# Step 8: All reports in one pass (SQL reports are streamed from the DB)
+def stage_reports(inputs, fmt):
+    from reports import build_report_sources, export_reports
+    # reconcile returns None when it was skipped (sales / bank unchanged)
+    reports = inputs["reconcile"] or build_report_sources()
+    report_counts = export_reports(reports, REPORTS_BASENAME, fmt)
+    print("Report rows:", report_counts)
+    return report_counts
 
-    # Step 8: Automatic sales vs bank credit reconciliation
-    recon_results = reconcile_sales_vs_bank()
-    print("Unmatched sales:", recon_results['unmatched_sales'])
-    print("Unmatched bank credits:", recon_results['unmatched_credits'])
-    print("Duplicate credits:", recon_results['duplicates'])
-
-    export_report_to_excel(recon_results['unmatched_sales'], "reports/unmatched_sales.xlsx")
-    export_report_to_excel(recon_results['unmatched_credits'], "reports/unmatched_bank_credits.xlsx")
-    export_report_to_excel(recon_results['duplicates'], "reports/duplicate_bank_credits.xlsx")
-
-    # ---- Step 9: Visualization ----
-    # ---- Step 9: Visualization ----
+# ---- Step 9: Visualization ----
+def stage_charts(inputs, parallel):
+    from visualize import run_all_visualizations
     print("Generating charts...")
-    daily_file = plot_daily_reconciliation()
-    debit_cat_file = plot_debit_categories()
-    monthly_file = plot_monthly_debits()
-    stacked_file = plot_stacked_debit_categories()
-    credit_debit_file = plot_debit_vs_credit_interactive()
+    chart_files = run_all_visualizations(parallel=parallel)
     print("Charts generated:")
-    print(daily_file, debit_cat_file, monthly_file, stacked_file, credit_debit_file)
+    print(*chart_files.values())
+    os.makedirs(os.path.dirname(CHARTS_MANIFEST), exist_ok=True)
+    with open(CHARTS_MANIFEST, "w") as f:
+        json.dump(chart_files, f)
+    return chart_files
+
+
+# ---------------- STAGE INPUTS ----------------
+def schema_inputs():
+    from models import TABLES, COLUMNS, INDEXES
+    return {"tables": TABLES, "columns": COLUMNS, "indexes": INDEXES}
+
+def rules_inputs():
+    from migrate import INITIAL_RULES
+    return {"rules": INITIAL_RULES}
+
+def all_files_ok(results):
+    """An import is complete when every file was imported; otherwise it is retried."""
+    return all(r.get("status") == "ok" for r in results or [])
+
+def report_outputs(fmt):
+    pattern = f"{REPORTS_BASENAME}.xlsx" if fmt == "xlsx" else f"{REPORTS_BASENAME}_*.{fmt}"
+    return sorted(glob.glob(pattern))
+
+def chart_outputs_missing():
+    """True when the files of the last charts run were deleted (by hand or by gc_chart_cache)."""
+    try:
+        with open(CHARTS_MANIFEST) as f:
+            files = json.load(f).values()
+    except (OSError, ValueError):
+        return True
+    return not all(os.path.exists(path) for path in files)
+
+
+def build_stages(args):
+    stages = [
+        Stage("schema", stage_schema, [], schema_inputs),
+        Stage("rules", stage_rules, ["schema"], rules_inputs),
+        Stage("import_sales", stage_import_sales, ["schema"],
+              lambda: folder_hashes(SALES_DIR, (".xlsx",)), all_files_ok),
+        # both importers rewrite daily_reconciliation rows for their days;
+        # running them one after the other avoids lock contention on the rollup
+        Stage("import_bank", stage_import_bank, ["schema", "import_sales"],
+              lambda: folder_hashes(BANK_DIR, (".csv",)), all_files_ok),
+        Stage("classify", stage_classify, ["rules", "import_bank"],
+              lambda: get_table_versions("bank_transactions", "debit_classifications")),
+        Stage("reconcile", stage_reconcile, ["import_sales", "import_bank"],
+              lambda: get_table_versions("sales", "bank_transactions")),
+        Stage("reports", lambda inputs: stage_reports(inputs, args.format), ["reconcile", "classify"],
+              lambda: {
+                  "tables": get_table_versions("sales", "bank_transactions", "debit_classifications_applied"),
+                  "format": args.format,
+              }),
+    ]
+    if not args.no_charts:
+        stages.append(
+            Stage("charts", lambda inputs: stage_charts(inputs, args.parallel_charts), ["import_sales", "classify"],
+                  lambda: get_table_versions("daily_reconciliation", "bank_transactions",
+                                             "debit_classifications_applied"))
+        )
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sales analysis pipeline")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default="xlsx",
+                        help="Output format for the reports (default: xlsx)")
+    parser.add_argument("--parallel-charts", action="store_true",
+                        help="Fetch chart data concurrently and render charts in a process pool")
+    parser.add_argument("--no-charts", action="store_true",
+                        help="Skip chart generation (import, classify and report only)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Maximum number of stages running at once (default: no limit)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="Run STAGE even if its inputs are unchanged (repeatable; 'all' for every stage)")
+    args = parser.parse_args()
+
+    print(f"⏱  Startup: {(time.perf_counter() - STARTED) * 1000:.0f} ms")
+
+    stages = build_stages(args)
+    unknown = set(args.force) - {s.name for s in stages} - {"all"}
+    if unknown:
+        parser.error(f"unknown stage(s) for --force: {', '.join(sorted(unknown))}")
+
+    force = set(args.force)
+    # the reports fingerprint covers the data, not the files: export again
+    # when they were deleted (or never written in this format)
+    if not report_outputs(args.format):
+        force.add("reports")
+    # same for charts
+    if not args.no_charts and chart_outputs_missing():
+        force.add("charts")
 
+    runs = run_stages(
+        stages,
+        max_workers=args.jobs,
+        previous=load_stage_fingerprints(),
+        force=force,
+        on_success=save_stage_fingerprint,
+    )
+    print_summary(stages, runs)
 
+    if any(r.status in ("failed", "partial", "blocked") for r in runs.values()):
+        raise SystemExit(1)
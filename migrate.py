@@ -1,31 +1,34 @@
 from models import create_tables
 from db import execute_query
+from versions import bump_table_versions
+
+# Optional: sample debit classifications
+INITIAL_RULES = [
+    ("REPSOL", "Fuel"),
+    ("EDP", "Electricity"),
+    ("VNC", "Salaries"),
+    ("IVA", "VAT"),
+    ("IGFSS", "Segurança Social"),
+    ("INSTITUTO REGISTOS", "Serviços Notariado"),
+    ("COMPRA", "Compras"),
+    ("MANUT CONTA", "Man. Conta"),
+    ("PAG", "Fornecedores"),
+    ("SCALMATICA", "Sistema POS"),
+    ("DEB FACTURAS NETCAIXA", "Man. Conta"),
+    ("PROSEGUR", "Alarme"),
+    ("MEO", "Internet"),
+    ("PROSEGUR", "Alarme"),
+    ("Multi Imposto", "Impostos"),
+    ("TRF SDT", "Fornecedores"),
+    ("RENDA", "Renda"),
+    ("DISP CARTAO DEBITO", "Man. Conta"),
+    ("IMPOSTO", "Impostos"),
+    ("PAGAMENTO", "Pagamento"),
+]
+
 
 def migrate_initial_data():
-    # Optional: sample debit classifications
-    rules = [
-        ("REPSOL", "Fuel"),
-        ("EDP", "Electricity"),
-        ("VNC", "Salaries"),
-        ("IVA", "VAT"),
-        ("IGFSS", "Segurança Social"),
-        ("INSTITUTO REGISTOS", "Serviços Notariado"),
-        ("COMPRA", "Compras"),
-        ("MANUT CONTA", "Man. Conta"),
-        ("PAG", "Fornecedores"),
-        ("SCALMATICA", "Sistema POS"),
-        ("DEB FACTURAS NETCAIXA", "Man. Conta"),
-        ("PROSEGUR", "Alarme"),
-        ("MEO", "Internet"),
-        ("PROSEGUR", "Alarme"),
-        ("Multi Imposto", "Impostos"),
-        ("TRF SDT", "Fornecedores"),
-        ("RENDA", "Renda"),
-        ("DISP CARTAO DEBITO", "Man. Conta"),
-        ("IMPOSTO", "Impostos"),
-        ("PAGAMENTO", "Pagamento"),
-    ]
-    for pattern, category in rules:
+    for pattern, category in INITIAL_RULES:
         execute_query(
             """
             INSERT INTO debit_classifications (description_pattern, category)
@@ -36,6 +39,8 @@ def migrate_initial_data():
             (pattern, category)
         )
 
+    bump_table_versions(None, "debit_classifications")
     print("Initial debit classification rules inserted.")
 
-migrate_initial_data()
+if __name__ == "__main__":
+    migrate_initial_data()
@@ -1,4 +1,5 @@
-from db import execute_query
+from db import execute_query, get_connection
+from versions import bump_table_versions
 
 TABLES = {
     "sales": """
@@ -20,7 +21,10 @@ TABLES = {
         amount DECIMAL(12,2) NOT NULL,
         transaction_type ENUM('credit','debit') NOT NULL,
         source_file VARCHAR(255),
-        UNIQUE KEY uniq_tx (transaction_date, amount, description)
+        terminal_id VARCHAR(20),
+        UNIQUE KEY uniq_tx (transaction_date, amount, description),
+        KEY idx_terminal_date (terminal_id, transaction_date),
+        KEY idx_date_type (transaction_date, transaction_type)
     )
     """,
     "debit_classifications": """
@@ -37,10 +41,128 @@ TABLES = {
         category VARCHAR(100) NOT NULL,
         FOREIGN KEY (transaction_id) REFERENCES bank_transactions(id) ON DELETE CASCADE
     )
+    """,
+    # Daily rollup maintained by daily_rollup.refresh_daily_reconciliation()
+    "daily_reconciliation": """
+    CREATE TABLE IF NOT EXISTS daily_reconciliation (
+        date DATE PRIMARY KEY,
+        sales_card DECIMAL(12,2) NOT NULL DEFAULT 0,
+        sales_cash DECIMAL(12,2) NOT NULL DEFAULT 0,
+        sales_other DECIMAL(12,2) NOT NULL DEFAULT 0,
+        sales DECIMAL(12,2) NOT NULL DEFAULT 0,
+        bank_pos DECIMAL(12,2) NOT NULL DEFAULT 0,
+        bank_deposit DECIMAL(12,2) NOT NULL DEFAULT 0,
+        bank_other DECIMAL(12,2) NOT NULL DEFAULT 0,
+        bank DECIMAL(12,2) NOT NULL DEFAULT 0,
+        debits DECIMAL(12,2) NOT NULL DEFAULT 0,
+        tsc DECIMAL(12,2) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    # Change counters, bumped by versions.bump_table_versions() in every write transaction
+    "table_versions": """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name VARCHAR(64) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    # Input fingerprint of each main.py stage's last successful run
+    "pipeline_stages": """
+    CREATE TABLE IF NOT EXISTS pipeline_stages (
+        stage VARCHAR(64) PRIMARY KEY,
+        fingerprint CHAR(64) NOT NULL,
+        finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
     """
 }
 
+# Columns / indexes added after the first deployment.
+# (table, column, column DDL)
+COLUMNS = [
+    ("bank_transactions", "terminal_id", "terminal_id VARCHAR(20)"),
+]
+
+# (table, index name, index DDL)
+INDEXES = [
+    ("bank_transactions", "idx_terminal_date", "KEY idx_terminal_date (terminal_id, transaction_date)"),
+    ("bank_transactions", "idx_date_type", "KEY idx_date_type (transaction_date, transaction_type)"),
+]
+
+# Backfills that run right after a column is added.
+def backfill_terminal_ids():
+    """terminal_id of rows imported before the column existed ("<id> POS ..." descriptions)."""
+    # parsed in Python with the importer's regex (REGEXP_SUBSTR needs MySQL 8)
+    from import_csv import extract_terminal_id
+
+    rows = execute_query(
+        "SELECT id, description FROM bank_transactions WHERE description LIKE %s",
+        ("% POS%",),
+        fetch=True
+    )
+    updates = [(extract_terminal_id(r["description"]), r["id"]) for r in rows or []]
+    updates = [u for u in updates if u[0]]
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if updates:
+            cursor.executemany("UPDATE bank_transactions SET terminal_id = %s WHERE id = %s", updates)
+        bump_table_versions(cursor, "bank_transactions")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+BACKFILLS = {
+    ("bank_transactions", "terminal_id"): backfill_terminal_ids,
+}
+
+
+def column_exists(table, column):
+    rows = execute_query(
+        """
+        SELECT COUNT(*) AS n
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """,
+        (table, column),
+        fetch=True
+    )
+    return bool(rows and rows[0]["n"])
+
+
+def index_exists(table, index):
+    rows = execute_query(
+        """
+        SELECT COUNT(*) AS n
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """,
+        (table, index),
+        fetch=True
+    )
+    return bool(rows and rows[0]["n"])
+
+
+def ensure_schema():
+    """Add columns / indexes missing from tables created by older versions."""
+    for table, column, ddl in COLUMNS:
+        if not column_exists(table, column):
+            execute_query(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+            if (table, column) in BACKFILLS:
+                BACKFILLS[(table, column)]()
+            print(f"Column '{table}.{column}' added.")
+
+    for table, index, ddl in INDEXES:
+        if not index_exists(table, index):
+            execute_query(f"ALTER TABLE {table} ADD {ddl}")
+            print(f"Index '{table}.{index}' added.")
+
+
 def create_tables():
     for name, ddl in TABLES.items():
         execute_query(ddl)
         print(f"Table '{name}' ensured.")
+    ensure_schema()
@@ -0,0 +1,166 @@
+"""
+Small DAG runner for the main.py pipeline.
+
+Each Stage names the stages it depends on; a stage starts as soon as all of
+its dependencies have finished, so independent stages (reconciliation,
+charts, ...) run concurrently in a thread pool. A stage function receives
+{dependency name: dependency result}. Every stage is timed, and the run ends
+with a summary table and the critical path (the chain of dependencies that
+determined the total wall time).
+
+A stage may also declare `inputs`: a function returning a JSON-serializable
+description of everything it reads (file hashes, table versions, settings).
+It is evaluated when the stage becomes ready; if its fingerprint equals the
+one saved by the last successful run the stage is skipped (result None).
+A stage may also declare `complete`: a predicate on its result. A result
+that fails it (e.g. an import where some files had errors) ends the stage
+as 'partial': dependents still run, but the fingerprint is not saved, so
+the next run retries the stage.
+"""
+import hashlib
+import json
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+Stage = namedtuple("Stage", ["name", "fn", "deps", "inputs", "complete"], defaults=[None, None])
+StageRun = namedtuple("StageRun", ["status", "start", "end", "result", "error"])
+
+# statuses that let dependent stages run
+DONE = ("ok", "partial", "skipped")
+
+
+def fingerprint(inputs):
+    """sha256 of a JSON-serializable inputs description."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def check_graph(stages):
+    """Raise ValueError on unknown dependencies or cycles; return stages by name."""
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        for dep in s.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage {s.name!r} depends on unknown stage {dep!r}")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through stage {name!r}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for s in stages:
+        visit(s.name)
+    return by_name
+
+
+def _timed_call(stage, inputs, t0, previous, forced, on_success):
+    start = time.perf_counter() - t0
+    try:
+        fp = fingerprint(stage.inputs()) if stage.inputs else None
+        if fp is not None and not forced and previous.get(stage.name) == fp:
+            return StageRun("skipped", start, time.perf_counter() - t0, None, None)
+        result = stage.fn(inputs)
+        if stage.complete and not stage.complete(result):
+            return StageRun("partial", start, time.perf_counter() - t0, result, None)
+        if fp is not None and on_success:
+            on_success(stage.name, fp)
+    except Exception as e:
+        return StageRun("failed", start, time.perf_counter() - t0, None, e)
+    return StageRun("ok", start, time.perf_counter() - t0, result, None)
+
+
+def run_stages(stages, max_workers=None, previous=None, force=(), on_success=None):
+    """
+    Run stages in dependency order, concurrently where possible.
+    Returns {name: StageRun}. A failed stage marks everything downstream of it
+    as 'blocked'; independent branches still run.
+
+    previous: {stage: fingerprint} of the last successful runs; stages whose
+    inputs still match are skipped unless named in `force` ("all" forces
+    every stage). on_success(stage, fingerprint) is called after each
+    complete run.
+    """
+    by_name = check_graph(stages)
+    runs = {}
+    pending = dict(by_name)
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                dep_runs = [runs.get(d) for d in stage.deps]
+                if any(r is not None and r.status not in DONE for r in dep_runs):
+                    now = time.perf_counter() - t0
+                    runs[name] = StageRun("blocked", now, now, None, None)
+                    del pending[name]
+                elif all(r is not None for r in dep_runs):
+                    inputs = {d: runs[d].result for d in stage.deps}
+                    forced = name in force or "all" in force
+                    running[pool.submit(_timed_call, stage, inputs, t0, previous or {}, forced, on_success)] = name
+                    del pending[name]
+
+            if not running:
+                continue  # only blocked stages were resolved this round
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                runs[name] = future.result()
+                if runs[name].status == "failed":
+                    print(f"❌ Stage {name} failed:")
+                    traceback.print_exception(runs[name].error)
+
+    return runs
+
+
+def critical_path(stages, runs):
+    """
+    Stage names from the first to the last-finishing stage, each step going
+    to the dependency that finished last (the one the stage waited for).
+    """
+    by_name = {s.name: s for s in stages}
+    ran = {n: r for n, r in runs.items() if r.status != "blocked"}
+    if not ran:
+        return []
+
+    path = [max(ran, key=lambda n: ran[n].end)]
+    while True:
+        deps = [d for d in by_name[path[-1]].deps if d in ran]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda d: ran[d].end))
+    return path[::-1]
+
+
+def print_summary(stages, runs):
+    """Per-stage timings, total wall time and the critical path."""
+    wall = max((r.end for r in runs.values()), default=0.0)
+
+    print("⏱  Pipeline stages:")
+    print(f"   {'stage':<16} {'status':<8} {'start':>8} {'time':>8}")
+    for s in sorted(stages, key=lambda s: runs[s.name].start):
+        r = runs[s.name]
+        print(f"   {s.name:<16} {r.status:<8} {r.start:7.2f}s {r.end - r.start:7.2f}s")
+
+    path = critical_path(stages, runs)
+    path_time = sum(runs[n].end - runs[n].start for n in path)
+    print(f"   wall time {wall:.2f}s, stage time {sum(r.end - r.start for r in runs.values()):.2f}s")
+    print(f"   critical path ({path_time:.2f}s): {' → '.join(path)}")
+
+    partial = [s.name for s in stages if runs[s.name].status == "partial"]
+    if partial:
+        print(f"   partial (retried next run): {', '.join(partial)}")
+
+    skipped = [s.name for s in stages if runs[s.name].status == "skipped"]
+    if skipped:
+        print(f"   skipped (inputs unchanged): {', '.join(skipped)}")
@@ -1,28 +1,75 @@
-def get_daily_reconciliation(cursor):
-    cursor.execute("""
-        SELECT
-            s.sale_date,
-            CAST(s.amount AS DECIMAL(12,2)) AS sales,
-            CAST(IFNULL(b.bank_amount, 0) AS DECIMAL(12,2)) AS bank
-        FROM sales s
-        LEFT JOIN (
-            SELECT
-                transaction_date,
-                SUM(amount) AS bank_amount
-            FROM bank_transactions
-            GROUP BY transaction_date
-        ) b
-        ON s.sale_date = b.transaction_date
-        ORDER BY s.sale_date
-    """)
-
-    rows = cursor.fetchall()
-
-    return [
-        {
-            "date": r[0],
-            "sales": float(r[1]),
-            "bank": float(r[2]),
-        }
-        for r in rows
-    ]
+from datetime import date
+from db import execute_query
+
+# ---------------- MONTH RANGE ----------------
+def month_bounds(start_month=None, end_month=None):
+    """
+    'YYYY-MM' bounds -> (first day of start_month, first day after end_month).
+    Either side may be None (open range).
+    """
+    start = None
+    end = None
+    if start_month:
+        y, m = map(int, str(start_month).split("-")[:2])
+        start = date(y, m, 1)
+    if end_month:
+        y, m = map(int, str(end_month).split("-")[:2])
+        end = date(y + 1, 1, 1) if m == 12 else date(y, m + 1, 1)
+    return start, end
+
+def date_range_predicate(column, start_month=None, end_month=None):
+    """
+    Sargable month-range predicate on a DATE column (no functions on the
+    column, so its index can be used). Returns (sql, params); sql is
+    "1=1" when the range is open on both sides.
+    """
+    start, end = month_bounds(start_month, end_month)
+    clauses = []
+    params = []
+    if start:
+        clauses.append(f"{column} >= %s")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} < %s")
+        params.append(end)
+    return (" AND ".join(clauses) or "1=1"), params
+
+# ---------------- PER-MONTH AGGREGATES ----------------
+def monthly_bank_totals(start_month=None, end_month=None, transaction_type=None):
+    """Bank totals per month and transaction type: [{month, type, total}]."""
+    where, params = date_range_predicate("transaction_date", start_month, end_month)
+    if transaction_type:
+        where += " AND transaction_type = %s"
+        params.append(transaction_type)
+
+    return execute_query(f"""
+        SELECT DATE_FORMAT(transaction_date, '%Y-%m') AS month, transaction_type AS type, SUM(amount) AS total
+        FROM bank_transactions
+        WHERE {where}
+        GROUP BY month, transaction_type
+        ORDER BY month
+    """, params, fetch=True)
+
+def monthly_debit_categories(start_month=None, end_month=None):
+    """Classified debit totals per month and category: [{month, category, total}]."""
+    where, params = date_range_predicate("b.transaction_date", start_month, end_month)
+
+    return execute_query(f"""
+        SELECT DATE_FORMAT(b.transaction_date, '%Y-%m') AS month, d.category, SUM(b.amount) AS total
+        FROM debit_classifications_applied d
+        JOIN bank_transactions b ON d.transaction_id = b.id
+        WHERE {where}
+        GROUP BY month, d.category
+        ORDER BY month
+    """, params, fetch=True)
+
+def daily_reconciliation_rows(start_month=None, end_month=None):
+    """Daily sales vs bank rows: [{date, sales, bank}]."""
+    where, params = date_range_predicate("date", start_month, end_month)
+
+    return execute_query(f"""
+        SELECT date, sales, bank
+        FROM daily_reconciliation
+        WHERE {where}
+        ORDER BY date
+    """, params, fetch=True)
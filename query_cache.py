@@ -0,0 +1,202 @@
+"""
+Version-checked result cache for the dashboard.
+
+cached_value() computes a value once per combination of a key and the
+table_versions of the tables it is derived from; cached_query() does the
+same for one SELECT (key: the SQL text and its parameters). A lookup first
+reads the current versions (one primary-key query) and only serves the
+entry when they are unchanged. Every write path bumps its table's version
+in the same transaction as its rows, so an entry is stale from the moment
+an import or classification change commits, in this process or any other
+(main.py, another worker).
+
+Two backends, chosen by QUERY_CACHE_BACKEND in config:
+- "memory": an LRU dict in this process.
+- "sqlite": an LRU table in a SQLite file (QUERY_CACHE_PATH) shared by every
+  dashboard worker on the host, so workers don't each recompute the same
+  aggregates. Values are pickled.
+Both hold at most QUERY_CACHE_MAX_BYTES and evict the least recently used
+entries first. Cached values may be shared between callers: treat them as
+read-only.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import QUERY_CACHE_BACKEND, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_PATH
+from db import execute_query
+from versions import get_table_versions
+
+# values larger than this share of the cache are not cached
+MAX_ENTRY_SHARE = 4
+
+# SQLite backend: a hit refreshes the entry's LRU timestamp at most this
+# often (seconds), so reads don't all turn into writes
+TOUCH_INTERVAL = 60
+
+
+def estimate_size(value):
+    """Approximate memory of a result (rows, dicts, lists, numpy arrays) in bytes."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+def key_digest(key):
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+# ---------------- MEMORY BACKEND ----------------
+class ResultCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (versions, value, size)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, versions):
+        """The cached value when it was stored under the same versions, else None."""
+        key = key_digest(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != versions:
+                if entry is not None:
+                    self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, versions, value):
+        size = estimate_size(value)
+        if size > self.max_bytes // MAX_ENTRY_SHARE:
+            return
+        key = key_digest(key)
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (versions, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, key):
+        self.size -= self.entries.pop(key)[2]
+
+
+# ---------------- SQLITE BACKEND ----------------
+class SQLiteResultCache:
+    """
+    Same interface as ResultCache, stored in a SQLite file that several
+    processes open at once (WAL journal). Cache errors (e.g. a lock timeout)
+    count as misses, they never fail a request.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5)
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    versions TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_used ON entries (used)")
+        conn.close()
+
+    def _conn(self):
+        """
+        One connection per thread (sqlite3 connections are not thread-safe)
+        and per process (a connection must not be used across fork()).
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key, versions):
+        digest = key_digest(key)
+        try:
+            with self._conn() as conn:
+                row = conn.execute("SELECT versions, value, used FROM entries WHERE key = ?", (digest,)).fetchone()
+                if row is None:
+                    return None
+                if row[0] != json.dumps(versions):
+                    conn.execute("DELETE FROM entries WHERE key = ?", (digest,))
+                    return None
+                now = time.time()
+                if now - row[2] > TOUCH_INTERVAL:
+                    conn.execute("UPDATE entries SET used = ? WHERE key = ?", (now, digest))
+            return pickle.loads(row[1])
+        except sqlite3.Error:
+            return None
+
+    def put(self, key, versions, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes // MAX_ENTRY_SHARE:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, versions, value, size, used) VALUES (?, ?, ?, ?, ?)",
+                    (key_digest(key), json.dumps(versions), blob, len(blob), time.time())
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                while total > self.max_bytes:
+                    oldest = conn.execute("SELECT key, size FROM entries ORDER BY used LIMIT 16").fetchall()
+                    conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in oldest])
+                    total -= sum(size for _, size in oldest)
+        except sqlite3.Error:
+            pass
+
+
+def make_cache():
+    if QUERY_CACHE_BACKEND == "sqlite":
+        return SQLiteResultCache(QUERY_CACHE_PATH, QUERY_CACHE_MAX_BYTES)
+    return ResultCache(QUERY_CACHE_MAX_BYTES)
+
+
+_cache = make_cache()
+
+
+def cached_value(key, tables, compute):
+    """
+    compute() through the cache.
+    key: JSON-like tuple identifying the value (name and arguments).
+    tables: every table the value is derived from; their versions decide
+    whether a cached value is still valid.
+    """
+    versions = list(get_table_versions(*tables).items())
+    value = _cache.get(key, versions)
+    if value is None:
+        value = compute()
+        _cache.put(key, versions, value)
+    return value
+
+
+def cached_query(sql, params, tables):
+    """execute_query(sql, params, fetch=True) through the cache."""
+    key = ("sql", " ".join(sql.split()), tuple(params or ()))
+    return cached_value(key, tables, lambda: execute_query(sql, params, fetch=True))
@@ -1,47 +1,244 @@
-from db import execute_query
-from collections import defaultdict
+import csv
+import io
+import re
 import pandas as pd
+from decimal import Decimal
+from db import execute_query, stream_query
+from config import REPORT_FORMATS
+from reconciliation import reconcile_sales_vs_bank
+
+BATCH_SIZE = 5000
+
+# Columns stored as dictionary-encoded categoricals in columnar exports
+CATEGORICAL_COLUMNS = {"category", "transaction_type", "payment_method", "month"}
+# Money columns (besides "*_total"), exported as DECIMAL(14,2)
+AMOUNT_COLUMNS = {"amount", "total", "difference"}
+
+DEBIT_SUMMARY_SQL = """
+    SELECT dca.category, SUM(bt.amount) as total
+    FROM debit_classifications_applied dca
+    JOIN bank_transactions bt ON dca.transaction_id = bt.id
+    GROUP BY dca.category
+"""
+
+# Months present on either side are kept (full outer join over the month list).
+MONTHLY_RECONCILIATION_SQL = """
+    SELECT
+        m.month,
+        COALESCE(s.total_sales, 0) AS sales_total,
+        COALESCE(b.total_credits, 0) AS bank_total,
+        COALESCE(s.total_sales, 0) - COALESCE(b.total_credits, 0) AS difference
+    FROM (
+        SELECT DATE_FORMAT(sale_date,'%Y-%m') AS month FROM sales
+        UNION
+        SELECT DATE_FORMAT(transaction_date,'%Y-%m') FROM bank_transactions WHERE transaction_type='credit'
+    ) m
+    LEFT JOIN (
+        SELECT DATE_FORMAT(sale_date,'%Y-%m') AS month, SUM(amount) AS total_sales
+        FROM sales
+        GROUP BY month
+    ) s ON s.month = m.month
+    LEFT JOIN (
+        SELECT DATE_FORMAT(transaction_date,'%Y-%m') AS month, SUM(amount) AS total_credits
+        FROM bank_transactions
+        WHERE transaction_type='credit'
+        GROUP BY month
+    ) b ON b.month = m.month
+    ORDER BY m.month
+"""
 
 def debit_summary_by_category():
     """Return a summary of debits grouped by category."""
-    results = execute_query(
-        """
-        SELECT dca.category, SUM(bt.amount) as total
-        FROM debit_classifications_applied dca
-        JOIN bank_transactions bt ON dca.transaction_id = bt.id
-        GROUP BY dca.category
-        """,
-        fetch=True
-    )
-    return results
+    return execute_query(DEBIT_SUMMARY_SQL, fetch=True)
 
 def monthly_reconciliation():
     """Compare monthly sales vs monthly bank credits."""
-    sales = execute_query(
-        "SELECT DATE_FORMAT(sale_date,'%Y-%m') as month, SUM(amount) as total_sales FROM sales GROUP BY month",
-        fetch=True
-    )
-    bank = execute_query(
-        "SELECT DATE_FORMAT(transaction_date,'%Y-%m') as month, SUM(amount) as total_credits FROM bank_transactions WHERE transaction_type='credit' GROUP BY month",
-        fetch=True
-    )
-
-    bank_map = {b['month']: b['total_credits'] for b in bank}
-    reconciliation = []
-    for s in sales:
-        month = s['month']
-        sales_total = s['total_sales']
-        bank_total = bank_map.get(month, 0)
-        reconciliation.append({
-            'month': month,
-            'sales_total': sales_total,
-            'bank_total': bank_total,
-            'difference': sales_total - bank_total
-        })
-    return reconciliation
+    return execute_query(MONTHLY_RECONCILIATION_SQL, fetch=True)
 
-def export_report_to_excel(data, filename):
-    """Export a list of dicts to Excel."""
-    df = pd.DataFrame(data)
-    df.to_excel(filename, index=False)
+def iter_report_rows(data):
+    """
+    Yield a header tuple followed by row tuples.
+    `data` is either a SQL string (streamed from the server) or a list of dicts.
+    """
+    if isinstance(data, str):
+        yield from stream_query(data)
+        return
+
+    if not data:
+        return
+    columns = list(data[0].keys())
+    yield tuple(columns)
+    for row in data:
+        yield tuple(row.get(c) for c in columns)
+
+def write_sheet(wb, title, data):
+    """Append a report to a write-only workbook; returns the number of data rows."""
+    ws = wb.create_sheet(title=title[:31])
+    count = -1
+    for row in iter_report_rows(data):
+        ws.append(row)
+        count += 1
+    return max(count, 0)
+
+def write_workbook(reports, target):
+    """
+    Write several reports to one workbook (path or file object), one sheet each.
+    `reports` maps sheet title -> SQL string or list of dicts. Rows are
+    written in openpyxl write-only (streaming) mode, so memory stays constant.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    counts = {title: write_sheet(wb, title, data) for title, data in reports.items()}
+    wb.save(target)
+    return counts
+
+def export_reports_to_excel(reports, filename):
+    """Export several reports to one workbook in a single pass."""
+    counts = write_workbook(reports, filename)
     print(f"Report exported to {filename}")
+    return counts
+
+def export_report_to_excel(data, filename):
+    """Export a list of dicts (or a SQL query) to Excel."""
+    return export_reports_to_excel({"Report": data}, filename)["Report"]
+
+# Reports that are a single SQL query (streamed straight from the DB)
+REPORT_QUERIES = {
+    "Debit summary": DEBIT_SUMMARY_SQL,
+    "Monthly reconciliation": MONTHLY_RECONCILIATION_SQL,
+}
+
+def build_report_sources():
+    """All pipeline reports: sheet/file title -> SQL string or list of dicts."""
+    unmatched_sales, unmatched_credits, duplicates = reconcile_sales_vs_bank()
+    return {
+        **REPORT_QUERIES,
+        "Unmatched sales": unmatched_sales,
+        "Unmatched bank credits": unmatched_credits,
+        "Duplicate bank credits": duplicates,
+    }
+
+def report_slug(title):
+    """'Monthly reconciliation' -> 'monthly_reconciliation'"""
+    return re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+
+# ------------------ Columnar exports (Parquet / CSV) ------------------
+def iter_report_batches(data, batch_size=BATCH_SIZE):
+    """Yield typed DataFrames of at most `batch_size` rows."""
+    rows = iter_report_rows(data)
+    columns = next(rows, None)
+    if columns is None:
+        return
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield typed_frame(batch, columns)
+            batch = []
+    if batch:
+        yield typed_frame(batch, columns)
+
+def typed_frame(rows, columns):
+    """Dates as datetime64, categoricals for low-cardinality text, amounts as exact Decimals."""
+    df = pd.DataFrame(rows, columns=list(columns))
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype("category")
+        elif col == "date" or col.endswith("_date"):
+            df[col] = pd.to_datetime(df[col])
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].map(lambda v: None if pd.isna(v) else Decimal(f"{v:.2f}"))
+    return df
+
+def arrow_type(column):
+    """
+    Arrow type of a report column, from its name: DECIMAL(14,2) amounts,
+    timestamps for dates, int64 ids, dictionary strings for categoricals,
+    plain strings otherwise.
+    """
+    import pyarrow as pa
+
+    if column in CATEGORICAL_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if column == "date" or column.endswith("_date"):
+        return pa.timestamp("ns")
+    if column in AMOUNT_COLUMNS or column.endswith("_total"):
+        return pa.decimal128(14, 2)
+    if column == "id" or column.endswith("_id"):
+        return pa.int64()
+    return pa.string()
+
+def arrow_schema(columns):
+    """
+    Fixed Arrow schema for every batch, from the report's columns rather than
+    the first batch's values (a column that is all NULL there would be typed
+    `null` and reject later batches).
+    """
+    import pyarrow as pa
+    return pa.schema([pa.field(c, arrow_type(c)) for c in columns])
+
+def write_parquet(data, target, batch_size=BATCH_SIZE):
+    """Write a report to Parquet one row group per batch; returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    count = 0
+    try:
+        for df in iter_report_batches(data, batch_size):
+            if writer is None:
+                schema = arrow_schema(df.columns)
+                writer = pq.ParquetWriter(target, schema)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            count += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def iter_csv_chunks(data, batch_size=BATCH_SIZE):
+    """Yield CSV text one batch at a time (header first)."""
+    rows = iter_report_rows(data)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def write_csv(data, target):
+    """Write a report to CSV row by row; returns the row count."""
+    count = -1
+    with open(target, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for row in iter_report_rows(data):
+            writer.writerow(row)
+            count += 1
+    return max(count, 0)
+
+def export_reports(reports, basename, fmt="xlsx"):
+    """
+    Export reports in the requested format.
+    xlsx -> one multi-sheet workbook `<basename>.xlsx`
+    parquet/csv -> one file per report `<basename>_<slug>.<fmt>`
+    Returns {title: rows}.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+
+    if fmt == "xlsx":
+        return export_reports_to_excel(reports, f"{basename}.xlsx")
+
+    writer = write_parquet if fmt == "parquet" else write_csv
+    counts = {}
+    for title, data in reports.items():
+        filename = f"{basename}_{report_slug(title)}.{fmt}"
+        counts[title] = writer(data, filename)
+        print(f"Report exported to {filename}")
+    return counts
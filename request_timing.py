@@ -0,0 +1,180 @@
+"""
+Per-request time accounting for the dashboard.
+
+start_request() installs a RequestTimings for the current context; timed(name)
+then charges the time spent in a block (or a decorated function) to `name`.
+Blocks nest and time is exclusive: SQL run inside a timed("pandas") function
+counts as sql only. db.get_connection() times every cursor call as "sql"
+while a request is being timed, so routes need no changes for SQL time and
+query counts. server_timing_header() formats the result for the
+Server-Timing response header (shown in the browser dev tools).
+
+Outside a request (importers, main.py, background jobs) timed() is a no-op.
+
+start_profiler() / save_profile() wrap an optional sampling profiler
+(pyinstrument, call-tree HTML); without it cProfile is used and a .prof
+file is written (open it with snakeviz or pstats).
+"""
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import pyinstrument
+except ImportError:  # optional: cProfile is used instead
+    pyinstrument = None
+
+_current = ContextVar("request_timings", default=None)
+
+# metric name -> Server-Timing description
+METRICS = {
+    "sql": "SQL",
+    "pandas": "pandas / numpy",
+    "render": "templates",
+}
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = dict.fromkeys(METRICS, 0.0)
+        self.queries = 0
+        self.stack = []  # [name, resumed_at]
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            outer = self.stack[-1]
+            self.totals[outer[0]] += now - outer[1]
+        self.stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, resumed = self.stack.pop()
+        self.totals[name] += now - resumed
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+def start_request():
+    """Start timing the current request."""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def end_request():
+    _current.set(None)
+
+
+def current_timings():
+    """The RequestTimings of the current request, or None."""
+    return _current.get()
+
+
+@contextmanager
+def timed(name, query=False):
+    """Charge the block to metric `name`; query=True also counts one SQL query."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    if query:
+        timings.queries += 1
+    timings.enter(name)
+    try:
+        yield
+    finally:
+        timings.exit()
+
+
+def server_timing_header(timings):
+    """'total;dur=12.3, sql;dur=4.5;desc="SQL (3 queries)", ...' in milliseconds."""
+    parts = [f"total;dur={timings.total() * 1000:.1f}"]
+    for name, desc in METRICS.items():
+        if name == "sql":
+            desc = f"SQL ({timings.queries} queries)"
+        parts.append(f'{name};dur={timings.totals[name] * 1000:.1f};desc="{desc}"')
+    return ", ".join(parts)
+
+
+# ---------------- DB CURSORS ----------------
+class TimedCursor:
+    """Cursor proxy charging execute / fetch calls to 'sql'."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        with timed("sql", query=True):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with timed("sql", query=True):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def fetchone(self):
+        with timed("sql"):
+            return self._cursor.fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with timed("sql"):
+            return self._cursor.fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with timed("sql"):
+            return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """Connection proxy whose cursors are TimedCursors."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# ---------------- PROFILER ----------------
+def start_profiler(interval):
+    """Start a profiler for one request (pyinstrument sampling every `interval` s, else cProfile)."""
+    if pyinstrument is not None:
+        profiler = pyinstrument.Profiler(interval=interval)
+        profiler.start()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def save_profile(profiler, folder, label):
+    """Stop the profiler and write its call tree to folder; returns the file path."""
+    os.makedirs(folder, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', label)}"
+
+    if pyinstrument is not None:
+        profiler.stop()
+        path = os.path.join(folder, f"{stem}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = os.path.join(folder, f"{stem}.prof")
+        profiler.dump_stats(path)
+    return path
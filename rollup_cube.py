@@ -0,0 +1,353 @@
+"""
+In-memory rollup cube for the dashboard process.
+
+A day × category × transaction_type array of cumulative sums (amount in
+cents and transaction count). Any date-range total is cum[end + 1] - cum[start],
+so category totals and day / week / month bucket series cost O(1) per bucket.
+Debits are also kept sorted by (category, date, id) so the transactions modal
+can page through one category and date range with a keyset cursor.
+Built lazily on first use, refreshed per date range after imports and
+rebuilt when the classification rules change. get_cube() also compares the
+table_versions of the tables it reads, so writes made by another process
+(main.py, another dashboard worker) trigger a rebuild too.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import execute_query
+from request_timing import timed
+from classify import classify_series, load_rules
+from versions import get_table_versions
+
+TRANSACTION_TYPES = ("debit", "credit")
+
+# tables the cube is built from
+CUBE_TABLES = ("bank_transactions", "debit_classifications")
+
+PAGE_SIZE = 50
+SORT_COLUMNS = {"date": "date", "amount": "cents"}
+EPOCH = pd.Timestamp("1970-01-01")
+DAY_KEY = 100_000  # > days since EPOCH, so category * DAY_KEY + day sorts by (category, day)
+
+
+def fetch_classified(start_date=None, end_date=None):
+    """Bank rows (optionally within a date range) with their category and |amount| in cents."""
+    where = ""
+    params = []
+    if start_date and end_date:
+        where = "WHERE transaction_date BETWEEN %s AND %s"
+        params = [start_date, end_date]
+
+    rows = execute_query(f"""
+        SELECT id, transaction_date AS date, description, amount, transaction_type
+        FROM bank_transactions
+        {where}
+    """, params, fetch=True)
+
+    df = pd.DataFrame(rows, columns=["id", "date", "description", "amount", "transaction_type"])
+    df["date"] = pd.to_datetime(df["date"])
+    df["cents"] = (df["amount"].astype(float).abs() * 100).round().astype("int64")
+    df["category"] = classify_series(df["description"], load_rules()) if not df.empty else []
+    return df
+
+
+def bucket_edges(start, end, view):
+    """
+    Bucket boundaries covering [start, end]: (labels, edges), where bucket i
+    spans days [edges[i], edges[i + 1]). Labels are the period start (Monday
+    for weekly, 1st for monthly), edges are clipped to the requested range.
+    """
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+
+    if view == "monthly":
+        labels = pd.date_range(start.to_period("M").start_time, end, freq="MS")
+    elif view == "weekly":
+        labels = pd.date_range(start.to_period("W").start_time, end, freq="W-MON")
+    else:
+        labels = pd.date_range(start, end, freq="D")
+
+    edges = labels.to_numpy(dtype="datetime64[D]").copy()
+    edges[0] = start.to_datetime64().astype("datetime64[D]")
+    edges = np.append(edges, (end + timedelta(days=1)).to_datetime64().astype("datetime64[D]"))
+    return labels, edges
+
+
+def _day(value):
+    return (pd.Timestamp(value) - EPOCH).days
+
+
+def encode_cursor(value, row_id):
+    """Keyset cursor for the last row of a page: '<date or cents>:<id>'."""
+    if isinstance(value, pd.Timestamp):
+        value = value.date().isoformat()
+    return f"{value}:{row_id}"
+
+
+def decode_cursor(cursor, sort):
+    """(value, id) of an encode_cursor() string; ValueError when malformed."""
+    value, _, row_id = cursor.rpartition(":")
+    value = pd.Timestamp(value) if sort == "date" else int(value)
+    return value, int(row_id)
+
+
+class RollupCube:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first_day = None
+        self.categories = []
+        self.cat_index = {}
+        self.daily = None   # (days, categories, types, 2) -> [cents, count]
+        self.cum = None     # (days + 1, categories, types, 2)
+        self.debits = None  # DataFrame sorted by (category, date, id)
+        self.debit_keys = None
+        self.versions = None  # table_versions of CUBE_TABLES the cube reflects
+
+    # ---------------- BUILD / REFRESH ----------------
+    @timed("pandas")
+    def build(self):
+        df = fetch_classified()
+        with self.lock:
+            self.first_day = df["date"].min() if not df.empty else None
+            self.categories = []
+            self.cat_index = {}
+            self.daily = None
+            self.cum = None
+            self.debits = None
+            self.debit_keys = None
+            if self.first_day is not None:
+                self._store(df, df["date"].min(), df["date"].max())
+
+    @timed("pandas")
+    def refresh(self, start_date, end_date):
+        """Recompute the days start_date..end_date after an import."""
+        if self.cum is None:
+            return self.build()
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        df = fetch_classified(start.date(), end.date())
+        with self.lock:
+            self._store(df, start, end)
+
+    def _store(self, df, start, end):
+        """Replace the daily slice [start, end] with df and rebuild prefix sums from start on."""
+        for category in df["category"].unique():
+            if category not in self.cat_index:
+                self.cat_index[category] = len(self.categories)
+                self.categories.append(category)
+
+        if self.first_day is None or start < self.first_day:
+            self._grow_front(start)
+        last_day = self.first_day + timedelta(days=(len(self.daily) - 1 if self.daily is not None else -1))
+        self._grow_back(max(end, last_day))
+
+        s = (start - self.first_day).days
+        e = (end - self.first_day).days + 1
+        self.daily[s:e] = 0
+
+        if not df.empty:
+            days = (df["date"] - self.first_day).dt.days.to_numpy()
+            cats = df["category"].map(self.cat_index).to_numpy()
+            types = df["transaction_type"].map({t: i for i, t in enumerate(TRANSACTION_TYPES)}).to_numpy()
+            np.add.at(self.daily, (days, cats, types, 0), df["cents"].to_numpy())
+            np.add.at(self.daily, (days, cats, types, 1), 1)
+
+        self.cum[s + 1:] = self.cum[s] + np.cumsum(self.daily[s:], axis=0)
+        self._store_debits(df, start, end)
+
+    def _store_debits(self, df, start, end):
+        """Replace the debits dated [start, end] and re-sort the (category, date, id) index."""
+        debits = df.loc[df["transaction_type"] == "debit", ["id", "date", "description", "cents", "category"]]
+        if self.debits is not None:
+            outside = (self.debits["date"] < start) | (self.debits["date"] > end)
+            debits = pd.concat([self.debits.loc[outside, debits.columns], debits])
+
+        debits = (
+            debits.assign(cat=debits["category"].map(self.cat_index).astype("int64"))
+            .sort_values(["cat", "date", "id"], ignore_index=True)
+        )
+        self.debits = debits
+        self.debit_keys = debits["cat"].to_numpy() * DAY_KEY + (debits["date"] - EPOCH).dt.days.to_numpy()
+
+    def _shape(self, days):
+        return (days, max(len(self.categories), 1), len(TRANSACTION_TYPES), 2)
+
+    def _grow_front(self, start):
+        extra = (self.first_day - start).days if self.first_day is not None else 0
+        old = self.daily if self.daily is not None else np.zeros(self._shape(0), dtype="int64")
+        self.first_day = start
+        self._resize(np.concatenate([np.zeros(self._shape(extra)[:1] + old.shape[1:], dtype="int64"), old]))
+
+    def _grow_back(self, end):
+        days = (end - self.first_day).days + 1
+        old = self.daily if self.daily is not None else np.zeros(self._shape(0), dtype="int64")
+        if days <= len(old) and old.shape[1] >= len(self.categories):
+            return
+        if days > len(old):
+            old = np.concatenate([old, np.zeros((days - len(old),) + old.shape[1:], dtype="int64")])
+        self._resize(old)
+
+    def _resize(self, daily):
+        """Pad the category axis for new categories and recompute all prefix sums."""
+        missing = len(self.categories) - daily.shape[1]
+        if missing > 0:
+            daily = np.concatenate([daily, np.zeros((daily.shape[0], missing) + daily.shape[2:], dtype="int64")], axis=1)
+        self.daily = daily
+        self.cum = np.concatenate([np.zeros((1,) + daily.shape[1:], dtype="int64"), np.cumsum(daily, axis=0)])
+
+    # ---------------- QUERIES ----------------
+    def _index(self, dates):
+        """Day offsets into cum, clipped to the cube (datetime64[D] array)."""
+        offsets = (dates - np.datetime64(self.first_day.date(), "D")).astype("int64")
+        return np.clip(offsets, 0, len(self.cum) - 1)
+
+    def _ranges(self, edges):
+        """cum differences between consecutive edges: (buckets, categories, types, 2)."""
+        idx = self._index(edges)
+        return self.cum[idx[1:]] - self.cum[idx[:-1]]
+
+    def category_totals(self, start_date, end_date, transaction_type="debit"):
+        """{category: (cents, count)} for one transaction type over [start_date, end_date]."""
+        with self.lock:
+            if self.cum is None:
+                return {}
+            edges = np.array([
+                pd.Timestamp(start_date).to_datetime64(),
+                (pd.Timestamp(end_date) + timedelta(days=1)).to_datetime64(),
+            ]).astype("datetime64[D]")
+            totals = self._ranges(edges)[0, :, TRANSACTION_TYPES.index(transaction_type)]
+            return {
+                cat: (int(totals[i, 0]), int(totals[i, 1]))
+                for cat, i in self.cat_index.items()
+                if totals[i, 1]
+            }
+
+    def series(self, start_date, end_date, view, transaction_type="debit", categories=None):
+        """
+        Bucket labels plus cents per bucket: {category: array} when categories
+        is given, else the total over all categories.
+        """
+        labels, edges = bucket_edges(start_date, end_date, view)
+        with self.lock:
+            if self.cum is None:
+                empty = np.zeros(len(labels), dtype="int64")
+                return labels, ({c: empty for c in categories} if categories is not None else empty)
+            values = self._ranges(edges)[:, :, TRANSACTION_TYPES.index(transaction_type), 0]
+            if categories is None:
+                return labels, values.sum(axis=1)
+            return labels, {
+                c: values[:, self.cat_index[c]] if c in self.cat_index else np.zeros(len(labels), dtype="int64")
+                for c in categories
+            }
+
+    def debit_page(self, category, start_date, end_date, sort="date", descending=False, cursor=None, limit=PAGE_SIZE):
+        """
+        One page of a category's debits in [start_date, end_date], ordered by
+        (sort column, id). The range is a binary search on the index; cursor
+        is the value returned as next_cursor by the previous page.
+        """
+        with self.lock:
+            if self.debits is None or category not in self.cat_index:
+                rows = pd.DataFrame(columns=["id", "date", "description", "cents"])
+            else:
+                base = self.cat_index[category] * DAY_KEY
+                lo = np.searchsorted(self.debit_keys, base + _day(start_date), "left")
+                hi = np.searchsorted(self.debit_keys, base + _day(end_date), "right")
+                rows = self.debits.iloc[lo:hi]
+
+        count = len(rows)
+        total_cents = int(rows["cents"].sum()) if count else 0
+
+        column = SORT_COLUMNS[sort]
+        if sort != "date":
+            rows = rows.iloc[np.lexsort((rows["id"].to_numpy(), rows[column].to_numpy()))]
+        if descending:
+            rows = rows.iloc[::-1]
+
+        if cursor:
+            value, row_id = decode_cursor(cursor, sort)
+            values = rows[column].to_numpy()
+            ids = rows["id"].to_numpy()
+            value = np.datetime64(value) if sort == "date" else value
+            if descending:
+                after = (values < value) | ((values == value) & (ids < row_id))
+            else:
+                after = (values > value) | ((values == value) & (ids > row_id))
+            rows = rows[after]
+
+        page = rows.iloc[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page.iloc[-1]
+            next_cursor = encode_cursor(last[column], last["id"])
+
+        return {
+            "rows": [
+                {"date": r.date.date().isoformat(), "description": r.description, "amount": r.cents / 100}
+                for r in page.itertuples(index=False)
+            ],
+            "count": count,
+            "total_amount": total_cents / 100,
+            "next_cursor": next_cursor,
+        }
+
+
+_cube = RollupCube()
+_built = False
+_build_lock = threading.Lock()
+
+
+def get_cube():
+    """The process-wide cube, (re)built on first use and whenever CUBE_TABLES changed."""
+    global _built
+    versions = get_table_versions(*CUBE_TABLES)
+    if not _built or versions != _cube.versions:
+        with _build_lock:
+            if not _built or versions != _cube.versions:
+                # versions are read before building: a write committed during
+                # the build shows up as a newer version and rebuilds again
+                _cube.build()
+                _cube.versions = versions
+                _built = True
+    return _cube
+
+
+def refresh_cube_for_results(results):
+    """
+    After bank imports in this process: refresh the transaction_date range
+    each importer result dict reports (status ok + transaction_min/max_date).
+    Each such file bumped bank_transactions once; the cube is rebuilt instead
+    when a file's range is unknown or the versions moved by anything else (a
+    write by another process, a rules change), since a refresh would mark
+    that write as seen without loading it.
+    """
+    imported = [r for r in results if r.get("status") == "ok"]
+    if not imported:
+        return
+    ranges = [
+        (pd.Timestamp(r["transaction_min_date"]), pd.Timestamp(r["transaction_max_date"]))
+        for r in imported
+        if r.get("transaction_min_date") and r.get("transaction_max_date")
+    ]
+
+    with _build_lock:
+        if not _built:
+            return
+        versions = get_table_versions(*CUBE_TABLES)
+        if versions == _cube.versions:
+            return  # already rebuilt by get_cube() since the import committed
+        expected = dict(_cube.versions, bank_transactions=_cube.versions["bank_transactions"] + len(imported))
+        if versions == expected and len(ranges) == len(imported):
+            for start, end in ranges:
+                _cube.refresh(start, end)
+        else:
+            _cube.build()
+        _cube.versions = versions
+
+
+def invalidate_cube():
+    """Classification rules changed: rebuild on next use."""
+    global _built
+    _built = False
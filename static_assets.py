@@ -0,0 +1,38 @@
+"""
+Front-end assets served from dashboard/static.
+
+plotly.js is copied once per version from the plotly Python package into
+dashboard/static/vendor, so dashboard pages and exported interactive charts
+reference a single local file (works offline). The file name carries the
+plotly.js version, which lets the dashboard serve it with a long-lived,
+immutable Cache-Control header.
+"""
+import os
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard", "static")
+VENDOR_DIR = os.path.join(STATIC_DIR, "vendor")
+VENDOR_MAX_AGE = 365 * 24 * 3600
+
+
+def plotly_js_filename():
+    """'plotly-<version>.min.js' for the plotly.js bundled with the installed plotly."""
+    from plotly.offline import get_plotlyjs_version
+    return f"plotly-{get_plotlyjs_version()}.min.js"
+
+
+def ensure_plotly_js():
+    """Write the bundled plotly.js into VENDOR_DIR if this version is missing; returns its path."""
+    path = os.path.join(VENDOR_DIR, plotly_js_filename())
+    if not os.path.exists(path):
+        from plotly.offline import get_plotlyjs
+        os.makedirs(VENDOR_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp, path)
+    return path
+
+
+def plotly_js_src(from_dir):
+    """Relative src of the local plotly.js for an HTML file written in from_dir."""
+    return os.path.relpath(ensure_plotly_js(), os.path.abspath(from_dir)).replace(os.sep, "/")
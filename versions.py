@@ -0,0 +1,83 @@
+"""
+Change tracking for incremental main.py runs.
+
+table_versions keeps one counter per table. Every write path bumps it in the
+same transaction as its rows (bump_table_versions(cursor, ...)), so a
+stage can tell whether the tables it reads changed since its last run.
+Stage fingerprints (sha256 of a stage's inputs: file hashes, table
+versions, settings) are stored in pipeline_stages.
+"""
+import hashlib
+import os
+
+import mysql.connector
+
+from db import execute_query
+
+_BUMP_SQL = """
+    INSERT INTO table_versions (table_name, version) VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+
+# ---------------- TABLE VERSIONS ----------------
+def bump_table_versions(cursor, *tables):
+    """Increment the version of each table; cursor=None uses its own connection."""
+    for table in tables:
+        if cursor is None:
+            execute_query(_BUMP_SQL, (table,))
+        else:
+            cursor.execute(_BUMP_SQL, (table,))
+
+
+def get_table_versions(*tables):
+    """{table: version} (0 for tables never written)."""
+    placeholders = ",".join(["%s"] * len(tables))
+    rows = execute_query(
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})",
+        tables,
+        fetch=True
+    )
+    versions = {t: 0 for t in tables}
+    versions.update({r["table_name"]: r["version"] for r in rows or []})
+    return versions
+
+
+# ---------------- FILE HASHES ----------------
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def folder_hashes(folder, suffixes):
+    """{file name: sha256} for the files in folder ending with one of suffixes."""
+    if not os.path.isdir(folder):
+        return {}
+    return {
+        name: file_hash(os.path.join(folder, name))
+        for name in sorted(os.listdir(folder))
+        if name.lower().endswith(suffixes)
+    }
+
+
+# ---------------- STAGE FINGERPRINTS ----------------
+def load_stage_fingerprints():
+    """{stage: fingerprint} of the last successful runs ({} before the schema exists)."""
+    try:
+        rows = execute_query("SELECT stage, fingerprint FROM pipeline_stages", fetch=True)
+    except mysql.connector.Error:
+        return {}
+    return {r["stage"]: r["fingerprint"] for r in rows or []}
+
+
+def save_stage_fingerprint(stage, fingerprint):
+    execute_query(
+        """
+        INSERT INTO pipeline_stages (stage, fingerprint) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE fingerprint = VALUES(fingerprint)
+        """,
+        (stage, fingerprint)
+    )
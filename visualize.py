@@ -1,30 +1,105 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
-from db import execute_query, get_connection
+from queries import daily_reconciliation_rows, monthly_bank_totals, monthly_debit_categories
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image as XLImage
-import plotly.graph_objs as go
-import plotly.offline as pyo
+from static_assets import plotly_js_src
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import json
+import multiprocessing
 import os
-
-sns.set_style("whitegrid")
+import time
 
 CHARTS_DIR = "dashboard/static/charts"
-os.makedirs(CHARTS_DIR, exist_ok=True)
+
+# Chart cache budget: renders older than this, or beyond this total size
+# (oldest first), are deleted from CHARTS_DIR.
+CHART_CACHE_MAX_BYTES = 50 * 1024 * 1024
+CHART_CACHE_MAX_AGE_DAYS = 30
+
+_plt = None
 
 # ------------------ Utility ------------------
-def save_and_show(title):
+def pyplot():
+    """
+    matplotlib.pyplot with the seaborn style, on the off-screen Agg backend:
+    charts are only saved to files, and main.py renders them on a pipeline
+    worker thread, where GUI backends (TkAgg, macosx) fail. matplotlib,
+    seaborn, plotly and openpyxl are imported on first use so that importing
+    this module (and runs that draw no charts) stay cheap.
+    """
+    global _plt
+    if _plt is None:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        plt.switch_backend("Agg")
+        sns.set_style("whitegrid")
+        _plt = plt
+    return _plt
+
+def chart_cache_path(title, df, *params):
+    """
+    Content-addressed file name for a chart: hash of the chart's input
+    data plus its parameters (start_month, end_month, ...).
+    """
+    h = hashlib.sha256()
+    h.update(title.encode())
+    h.update(json.dumps([str(p) for p in params]).encode())
+    h.update(json.dumps([str(c) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return f"{CHARTS_DIR}/{title}_{h.hexdigest()[:16]}.png"
+
+def cached_chart(filename):
+    """Return filename if it was already rendered (refreshing its age), else None."""
+    if not os.path.exists(filename):
+        return None
+    os.utime(filename)
+    print(f"📊 Chart unchanged, reusing {filename}")
+    return filename
+
+def gc_chart_cache(max_bytes=CHART_CACHE_MAX_BYTES, max_age_days=CHART_CACHE_MAX_AGE_DAYS):
+    """Evict PNG renders older than max_age_days, then oldest first until under max_bytes."""
+    now = time.time()
+    files = []
+    for name in os.listdir(CHARTS_DIR):
+        if not name.endswith(".png"):
+            continue
+        path = os.path.join(CHARTS_DIR, name)
+        try:
+            st = os.stat(path)
+            if now - st.st_mtime > max_age_days * 86400:
+                os.remove(path)
+                continue
+        except FileNotFoundError:
+            continue  # evicted by a concurrent render
+        files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def save_and_show(title, filename=None):
     """Save chart to file and return path"""
-    filename = f"{CHARTS_DIR}/{title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+    plt = pyplot()
+    if filename is None:
+        filename = f"{CHARTS_DIR}/{title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+    os.makedirs(CHARTS_DIR, exist_ok=True)
     plt.tight_layout()
     plt.savefig(filename, dpi=150)
     plt.close()
     print(f"📊 Chart exported to {filename}")
+    gc_chart_cache()
     return filename
 
 def export_charts_to_excel(image_paths, output_file):
+    from openpyxl import Workbook
+    from openpyxl.drawing.image import Image as XLImage
+
     wb = Workbook()
     ws = wb.active
     ws.title = "Charts"
@@ -40,60 +115,70 @@ def export_charts_to_excel(image_paths, output_file):
     wb.save(output_file)
     print(f"📘 Excel report created: {output_file}")
 
-# ------------------ Daily Reconciliation ------------------
-def plot_daily_reconciliation(start_month=None, end_month=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    data = execute_query("""SELECT date, sales, bank FROM daily_reconciliation""", fetch=True)
-    conn.close()
+def range_title(title, start_month, end_month):
+    if start_month or end_month:
+        s = start_month if start_month else "Start"
+        e = end_month if end_month else "End"
+        title += f" ({s} → {e})"
+    return title
 
+# ------------------ Daily Reconciliation ------------------
+def fetch_daily_reconciliation(start_month=None, end_month=None):
+    data = daily_reconciliation_rows(start_month, end_month)
     if not data:
-        print("⚠️ No daily reconciliation data")
-        return
+        return None
 
     df = pd.DataFrame(data)
     df["difference"] = df["sales"] - df["bank"]
     df["date"] = pd.to_datetime(df["date"])
+    return df
 
-    # Filter by month if requested
-    if start_month:
-        df = df[df["date"].dt.to_period("M") >= pd.Period(start_month)]
-    if end_month:
-        df = df[df["date"].dt.to_period("M") <= pd.Period(end_month)]
+def render_daily_reconciliation(df, start_month=None, end_month=None):
+    if df is None:
+        print("⚠️ No daily reconciliation data")
+        return
+
+    filename = chart_cache_path("daily_reconciliation", df, start_month, end_month)
+    if cached_chart(filename):
+        return filename
 
+    plt = pyplot()
     plt.figure(figsize=(12, 6))
     plt.plot(df["date"], df["sales"], label="Sales", marker="o")
     plt.plot(df["date"], df["bank"], label="Bank deposits", marker="o")
     plt.bar(df["date"], df["difference"], alpha=0.3, label="Difference")
     plt.axhline(0)
 
-    title = "Daily Sales vs Bank Reconciliation"
-    if start_month or end_month:
-        s = start_month if start_month else "Start"
-        e = end_month if end_month else "End"
-        title += f" ({s} → {e})"
-    plt.title(title)
+    plt.title(range_title("Daily Sales vs Bank Reconciliation", start_month, end_month))
     plt.xticks(rotation=45)
     plt.legend()
 
-    return save_and_show("daily_reconciliation")
+    return save_and_show("daily_reconciliation", filename)
+
+def plot_daily_reconciliation(start_month=None, end_month=None):
+    df = fetch_daily_reconciliation(start_month, end_month)
+    return render_daily_reconciliation(df, start_month, end_month)
 
 # ------------------ Debit Category ------------------
-def plot_debit_categories(start_month=None, end_month=None):
-    query = """
-        SELECT d.category, SUM(b.amount) AS total
-        FROM debit_classifications_applied d
-        JOIN bank_transactions b ON d.transaction_id = b.id
-        GROUP BY d.category
-    """
-    data = execute_query(query, fetch=True)
+def fetch_debit_categories(start_month=None, end_month=None):
+    data = monthly_debit_categories(start_month, end_month)
     if not data:
+        return None
+
+    df = pd.DataFrame(data, columns=["month", "category", "total"]).fillna(0)
+    df["total"] = df["total"].astype(float)
+    return df.groupby("category", as_index=False)["total"].sum()
+
+def render_debit_categories(df, start_month=None, end_month=None):
+    if df is None:
         print("⚠️ No debit category data")
         return
 
-    df = pd.DataFrame(data, columns=["category", "total"]).fillna(0)
-    df["total"] = df["total"].astype(float)
+    filename = chart_cache_path("debit_categories_top10", df, start_month, end_month)
+    if cached_chart(filename):
+        return filename
 
+    plt = pyplot()
     plt.figure(figsize=(10, 6))
     df_top = df.sort_values("total", key=abs, ascending=False).head(10)
     bars = plt.bar(df_top["category"], df_top["total"].abs())
@@ -101,107 +186,94 @@ def plot_debit_categories(start_month=None, end_month=None):
         plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(), f"{val:.2f}",
                  ha="center", va="bottom", fontsize=9)
 
-    title = "Top 10 Debit Categories"
-    if start_month or end_month:
-        s = start_month if start_month else "Start"
-        e = end_month if end_month else "End"
-        title += f" ({s} → {e})"
-    plt.title(title)
+    plt.title(range_title("Top 10 Debit Categories", start_month, end_month))
     plt.ylabel("Amount")
     plt.xticks(rotation=45, ha="right")
 
-    return save_and_show("debit_categories_top10")
+    return save_and_show("debit_categories_top10", filename)
 
-# ------------------ Monthly Debits ------------------
-def plot_monthly_debits(start_month=None, end_month=None):
-    data = execute_query("""
-        SELECT DATE_FORMAT(transaction_date, '%Y-%m') AS month, SUM(amount) AS total
-        FROM bank_transactions
-        WHERE transaction_type='debit'
-        GROUP BY month
-        ORDER BY month
-    """, fetch=True)
+def plot_debit_categories(start_month=None, end_month=None):
+    df = fetch_debit_categories(start_month, end_month)
+    return render_debit_categories(df, start_month, end_month)
 
+# ------------------ Monthly Debits ------------------
+def fetch_monthly_debits(start_month=None, end_month=None):
+    data = monthly_bank_totals(start_month, end_month, transaction_type="debit")
     if not data:
-        print("⚠️ No monthly debit data")
-        return
+        return None
 
     df = pd.DataFrame(data, columns=["month", "total"])
     df["total"] = df["total"].astype(float)
     df["month"] = pd.to_datetime(df["month"], format="%Y-%m")
+    return df
 
-    if start_month:
-        df = df[df["month"].dt.to_period("M") >= pd.Period(start_month)]
-    if end_month:
-        df = df[df["month"].dt.to_period("M") <= pd.Period(end_month)]
+def render_monthly_debits(df, start_month=None, end_month=None):
+    if df is None:
+        print("⚠️ No monthly debit data")
+        return
 
+    filename = chart_cache_path("monthly_debits", df, start_month, end_month)
+    if cached_chart(filename):
+        return filename
+
+    plt = pyplot()
     plt.figure(figsize=(10, 5))
     plt.bar(df["month"].dt.strftime("%Y-%m"), df["total"].abs())
-    title = "Monthly Debit Totals"
-    if start_month or end_month:
-        s = start_month if start_month else "Start"
-        e = end_month if end_month else "End"
-        title += f" ({s} → {e})"
-    plt.title(title)
+    plt.title(range_title("Monthly Debit Totals", start_month, end_month))
     plt.ylabel("Amount")
     plt.xticks(rotation=45)
 
-    return save_and_show("monthly_debits")
+    return save_and_show("monthly_debits", filename)
 
-# ------------------ Stacked Debit Categories ------------------
-def plot_stacked_debit_categories(start_month=None, end_month=None):
-    data = execute_query("""
-        SELECT DATE_FORMAT(b.transaction_date, '%Y-%m') AS month, d.category, SUM(b.amount) AS total
-        FROM debit_classifications_applied d
-        JOIN bank_transactions b ON d.transaction_id = b.id
-        GROUP BY month, d.category
-        ORDER BY month
-    """, fetch=True)
+def plot_monthly_debits(start_month=None, end_month=None):
+    df = fetch_monthly_debits(start_month, end_month)
+    return render_monthly_debits(df, start_month, end_month)
 
+# ------------------ Stacked Debit Categories ------------------
+def fetch_stacked_debit_categories(start_month=None, end_month=None):
+    data = monthly_debit_categories(start_month, end_month)
     if not data:
-        print("⚠️ No stacked debit data")
-        return
+        return None
 
     df = pd.DataFrame(data, columns=["month", "category", "total"])
     df["total"] = df["total"].astype(float)
     df["month"] = pd.to_datetime(df["month"], format="%Y-%m")
+    return df
 
-    if start_month:
-        df = df[df["month"].dt.to_period("M") >= pd.Period(start_month)]
-    if end_month:
-        df = df[df["month"].dt.to_period("M") <= pd.Period(end_month)]
+def render_stacked_debit_categories(df, start_month=None, end_month=None):
+    if df is None:
+        print("⚠️ No stacked debit data")
+        return
+
+    filename = chart_cache_path("stacked_debit_categories", df, start_month, end_month)
+    if cached_chart(filename):
+        return filename
 
+    plt = pyplot()
     pivot = df.pivot_table(index="month", columns="category", values="total", aggfunc="sum", fill_value=0)
     pivot.plot(kind="bar", stacked=True, figsize=(12, 6))
-    title = "Debit Categories by Month (Stacked)"
-    if start_month or end_month:
-        s = start_month if start_month else "Start"
-        e = end_month if end_month else "End"
-        title += f" ({s} → {e})"
-    plt.title(title)
+    plt.title(range_title("Debit Categories by Month (Stacked)", start_month, end_month))
     plt.ylabel("Amount")
     plt.xticks(rotation=45)
 
-    return save_and_show("stacked_debit_categories")
+    return save_and_show("stacked_debit_categories", filename)
+
+def plot_stacked_debit_categories(start_month=None, end_month=None):
+    df = fetch_stacked_debit_categories(start_month, end_month)
+    return render_stacked_debit_categories(df, start_month, end_month)
 
 # ------------------ Debit vs Credit Interactive ------------------
-def plot_debit_vs_credit_interactive(start_month=None, end_month=None):
-    data = execute_query("""
-        SELECT DATE_FORMAT(transaction_date, '%Y-%m') AS month, transaction_type, SUM(amount) AS total
-        FROM bank_transactions
-        GROUP BY month, transaction_type
-        ORDER BY month
-    """, fetch=True)
+def fetch_debit_vs_credit(start_month=None, end_month=None):
+    data = monthly_bank_totals(start_month, end_month)
 
     df = pd.DataFrame(data, columns=["month", "type", "total"])
     df["month"] = pd.to_datetime(df["month"], format="%Y-%m")
-    df["type"] = df["type"].str.lower().str.strip()
+    df["type"] = df["type"].astype(str).str.lower().str.strip()
     df["total"] = df["total"].astype(float)
+    return df
 
-    if start_month:
-        df = df[df["month"].dt.to_period("M") >= pd.Period(start_month)]
-    if end_month:
-        df = df[df["month"].dt.to_period("M") <= pd.Period(end_month)]
+def render_debit_vs_credit_interactive(df, start_month=None, end_month=None):
+    import plotly.graph_objs as go
 
     pivot = df.pivot_table(index="month", columns="type", values="total", aggfunc="sum", fill_value=0)
     debit_series = pivot.get("debit", pd.Series(0, index=pivot.index)).abs()
@@ -215,22 +287,76 @@ def plot_debit_vs_credit_interactive(start_month=None, end_month=None):
     fig.add_trace(go.Scatter(x=pivot.index, y=credit_avg, mode='lines', name='Credit (3M avg)', line=dict(color='green', dash='dash')))
     fig.add_trace(go.Scatter(x=pivot.index, y=debit_avg, mode='lines', name='Debit (3M avg)', line=dict(color='red', dash='dash')))
 
-    title = "Debit vs Credit with 3-Month Rolling Averages"
-    if start_month or end_month:
-        s = start_month if start_month else "Start"
-        e = end_month if end_month else "End"
-        title += f" ({s} → {e})"
+    title = range_title("Debit vs Credit with 3-Month Rolling Averages", start_month, end_month)
 
     fig.update_layout(title=title, xaxis_title='Month', yaxis_title='Amount', template='plotly_white')
     filename = f"{CHARTS_DIR}/debit_vs_credit_rolling.html"
-    pyo.plot(fig, filename=filename, auto_open=False)
+    # figure JSON only; plotly.js is the shared local copy in dashboard/static/vendor
+    os.makedirs(CHARTS_DIR, exist_ok=True)
+    fig.write_html(filename, include_plotlyjs=plotly_js_src(CHARTS_DIR), auto_open=False)
     print(f"📊 Interactive chart exported to {filename}")
     return filename
 
+def plot_debit_vs_credit_interactive(start_month=None, end_month=None):
+    df = fetch_debit_vs_credit(start_month, end_month)
+    return render_debit_vs_credit_interactive(df, start_month, end_month)
+
 # ------------------ Run All ------------------
-def run_all_visualizations(start_month=None, end_month=None):
-    plot_daily_reconciliation(start_month, end_month)
-    plot_debit_categories(start_month, end_month)
-    plot_monthly_debits(start_month, end_month)
-    plot_stacked_debit_categories(start_month, end_month)
-    plot_debit_vs_credit_interactive(start_month, end_month)
+# name -> (fetch, render); order is the order charts are reported in
+CHARTS = {
+    "daily_reconciliation": (fetch_daily_reconciliation, render_daily_reconciliation),
+    "debit_categories": (fetch_debit_categories, render_debit_categories),
+    "monthly_debits": (fetch_monthly_debits, render_monthly_debits),
+    "stacked_debit_categories": (fetch_stacked_debit_categories, render_stacked_debit_categories),
+    "debit_vs_credit": (fetch_debit_vs_credit, render_debit_vs_credit_interactive),
+}
+
+def _init_render_worker():
+    """Load pyplot (Agg) once per render process."""
+    pyplot()
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_all_visualizations(start_month=None, end_month=None, parallel=False, workers=None):
+    """
+    Render every chart and return {name: file}.
+    parallel=True fetches all datasets with concurrent queries (threads) and
+    renders the figures in a process pool on the Agg backend. File names are
+    the same in both modes.
+    """
+    timings = {}
+    files = {}
+
+    if not parallel:
+        for name, (fetch, render) in CHARTS.items():
+            df, fetch_s = _timed(fetch, start_month, end_month)
+            files[name], render_s = _timed(render, df, start_month, end_month)
+            timings[name] = (fetch_s, render_s)
+    else:
+        with ThreadPoolExecutor(max_workers=len(CHARTS)) as pool:
+            fetched = {
+                name: pool.submit(_timed, fetch, start_month, end_month)
+                for name, (fetch, _) in CHARTS.items()
+            }
+            datasets = {name: f.result() for name, f in fetched.items()}
+
+        # spawn, not fork: main.py calls this from a pipeline thread while other
+        # threads hold pooled MySQL connections and locks a fork would copy
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            rendered = {
+                name: pool.submit(_timed, render, datasets[name][0], start_month, end_month)
+                for name, (_, render) in CHARTS.items()
+            }
+            for name, f in rendered.items():
+                files[name], render_s = f.result()
+                timings[name] = (datasets[name][1], render_s)
+
+    print("⏱  Chart timings (fetch / render):")
+    for name, (fetch_s, render_s) in timings.items():
+        print(f"   {name:<26} {fetch_s:6.2f}s / {render_s:6.2f}s")
+
+    return files